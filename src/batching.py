@@ -0,0 +1,116 @@
+# batching.py → Coalesce /task calls headed to the same fog node into /task_batch requests
+#
+# A chunk sent to a node opens a batch, or joins the one already open for that node.
+# The caller that opened it waits BATCH_WINDOW for more chunks, then sends every chunk
+# of the batch in one request (a plain /task if it is alone) and hands each waiting caller
+# its own result. Callers still see one blocking call per chunk, so retries, hedging and
+# circuit breakers keep working chunk by chunk. Chunks above BATCH_MAX_BYTES / 2 gain
+# nothing from sharing a request and are sent on their own at once. Convergent-mode
+# chunks (see dedup.py) only share a request with chunks of the same salt.
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import http_pool
+from chunk_transport import (BATCH_MIME, CHUNK_MIME, CONVERGENT_HEADER,
+                             decode_batch_response, decode_task_response, encode_batch)
+from tracing import TRACE_HEADER, parse_server_timing
+
+BATCHING = os.environ.get("BATCHING", "1") == "1"
+BATCH_WINDOW = float(os.environ.get("BATCH_WINDOW", "0.002"))   # s an open batch waits
+BATCH_MAX_CHUNKS = int(os.environ.get("BATCH_MAX_CHUNKS", "16"))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# One chunk to encrypt: `data` is what goes on the wire (compressed or not), `size` the
+# plaintext bytes it stands for, the unit node models and chunk sizing work in
+ChunkTask = namedtuple("ChunkTask", ["data", "traceparent", "size"])
+
+
+def post_tasks(node, tasks, convergent=None, timeout=http_pool.READ_TIMEOUT):
+    """Encrypt the ChunkTasks on `node` in one request; decode_task_response-style dict each.
+
+    Each dict also gets "rtt" (the HTTP exchange, s) and "node_timing" (the node's
+    Server-Timing stages, shared by the chunks of a batch). A batch is sent with the
+    traceparent of its first traced chunk. `convergent` is the salt (hex) of convergent mode.
+    """
+    headers = {CONVERGENT_HEADER: convergent} if convergent else {}
+    parent = next((t.traceparent for t in tasks if t.traceparent), None)
+    if parent:
+        headers[TRACE_HEADER] = parent
+    start = time.time()
+    if len(tasks) == 1:
+        resp = http_pool.post(f"{node}/task", data=tasks[0].data, timeout=timeout,
+                              headers=dict(headers, Accept=CHUNK_MIME))
+        results = [decode_task_response(resp)]
+    else:
+        headers.update({"Content-Type": BATCH_MIME, "Accept": BATCH_MIME})
+        resp = http_pool.post(f"{node}/task_batch", data=encode_batch([t.data for t in tasks]),
+                              timeout=timeout, headers=headers)
+        results = decode_batch_response(resp)
+    rtt = time.time() - start
+    timing = parse_server_timing(resp.headers.get("Server-Timing"))
+    for data in results:
+        data.update(rtt=rtt, node_timing=timing)
+    return results
+
+
+class TaskBatcher:
+    """send(node, task, convergent) through `send_request(node, tasks, convergent) ->
+    [result per task]`, the balancer's wrapper around post_tasks (node slot, circuit
+    breaker, timing)."""
+
+    def __init__(self, send_request):
+        self.send_request = send_request
+        self.lock = threading.Lock()
+        self.open = {}   # (node, convergent) -> [(ChunkTask, Future)] still accepting chunks
+        self.requests = 0
+        self.batched = 0  # requests that carried more than one chunk
+        self.chunks = 0
+
+    def send(self, node, task, convergent=None):
+        if not BATCHING or len(task.data) > BATCH_MAX_BYTES // 2:
+            return self._request(node, [task], convergent)[0]
+
+        item = (task, Future())
+        with self.lock:
+            batch = self.open.get((node, convergent))
+            opener = (batch is None or len(batch) >= BATCH_MAX_CHUNKS
+                      or sum(len(t.data) for t, _ in batch) + len(task.data) > BATCH_MAX_BYTES)
+            if opener:
+                batch = self.open[node, convergent] = []
+            batch.append(item)
+
+        if opener:
+            time.sleep(BATCH_WINDOW)
+            with self.lock:
+                if self.open.get((node, convergent)) is batch:
+                    del self.open[node, convergent]
+            try:
+                results = self._request(node, [t for t, _ in batch], convergent)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), data in zip(batch, results):
+                    future.set_result(data)
+        return item[1].result()
+
+    def _request(self, node, tasks, convergent):
+        with self.lock:
+            self.requests += 1
+            self.chunks += len(tasks)
+            if len(tasks) > 1:
+                self.batched += 1
+        return self.send_request(node, tasks, convergent)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": BATCHING,
+                "requests": self.requests,
+                "batched_requests": self.batched,
+                "chunks": self.chunks,
+                "chunks_per_request": self.chunks / self.requests if self.requests else None,
+            }
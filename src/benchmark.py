@@ -0,0 +1,252 @@
+# benchmark.py → Compare the load balancers on local fog nodes, results as JSON
+#
+#   python benchmark.py --nodes 3 --rate 2 --duration 20 --sizes 1M:5,10M:3,50M:1
+#   python benchmark.py --node-kind stub --stub-latency 0.005,0.005,0.05 --out run.json
+#
+# For each balancer in turn: start --nodes fog nodes (real fog_node.py, or fog_stub.py with
+# per-node latency / MB/s) on loopback from --base-port, start the balancer, wait until every
+# node has registered, then run an open-loop workload: files arrive as a Poisson process
+# at --rate per second for --duration seconds, whatever the balancer's speed. At most
+# --concurrency uploads run at once, and latency counts from the planned arrival, so
+# time spent queued behind slow uploads is not hidden. Each balancer gets fresh processes.
+#
+# Report: throughput (MB/s), p50/p95/p99 file latency and chunks per node, per balancer.
+# --env KEY=VALUE (repeatable) is passed to every process, e.g. SCHEDULER=makespan.
+import argparse
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from chunk_transport import FRAMES_MIME, read_frames
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BALANCERS = {
+    "random": ("load_balancer_random.py", 5005),
+    "algo": ("load_balancer_algo.py", 5006),
+    "round_robin": ("load_balancer_rr.py", 5007),
+}
+UNITS = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+# "text" payloads are the sentence file of encrypted_client/generate.file.py
+_spec = importlib.util.spec_from_file_location(
+    "generate_file", os.path.join(HERE, "encrypted_client", "generate.file.py"))
+generate_file = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(generate_file)
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def parse_mix(text):
+    """"1M:5,10M:3" → [(size, weight)]; a size without weight counts 1."""
+    mix = []
+    for item in text.split(","):
+        size, _, weight = item.partition(":")
+        mix.append((parse_size(size), float(weight or 1)))
+    return mix
+
+
+def per_node(text, n):
+    """Comma-separated values, one per node (the last one repeats)."""
+    values = [float(v) for v in text.split(",")]
+    return [values[min(i, len(values) - 1)] for i in range(n)]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Cluster:
+    """Fog nodes + one balancer as subprocesses of this script."""
+
+    def __init__(self, args, balancer, log_dir):
+        self.args = args
+        self.script, self.port = BALANCERS[balancer]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_dir = log_dir
+        self.name = balancer
+        self.procs = []
+
+    def spawn(self, script, name, **env):
+        log = open(os.path.join(self.log_dir, f"{self.name}-{name}.log"), "w")
+        env = dict(os.environ, **self.args.env, **{k: str(v) for k, v in env.items()})
+        self.procs.append(subprocess.Popen([sys.executable, script], cwd=HERE, env=env,
+                                           stdout=log, stderr=subprocess.STDOUT))
+
+    def start(self):
+        a = self.args
+        self.spawn(self.script, "balancer", FOG_NODES="")
+        latencies = per_node(a.stub_latency, a.nodes)
+        speeds = per_node(a.stub_mbps, a.nodes)
+        for i in range(a.nodes):
+            port = a.base_port + i
+            env = {"PORT": port, "LOAD_BALANCERS": self.url, "ADVERTISE_URL": f"http://127.0.0.1:{port}"}
+            if a.node_kind == "stub":
+                self.spawn("fog_stub.py", f"node{port}", STUB_LATENCY=latencies[i],
+                           STUB_MBPS=speeds[i], STUB_SLOTS=a.stub_slots, **env)
+            else:
+                self.spawn("fog_node.py", f"node{port}", **env)
+        self.wait_ready()
+
+    def wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if len(requests.get(f"{self.url}/nodes", timeout=1).json()) >= self.args.nodes:
+                    return
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.name}: nodes did not register within {timeout}s "
+                           f"(logs in {self.log_dir})")
+
+    def stop(self):
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def upload(url, name, payload):
+    """Send one file to a balancer; returns the per-chunk results of its framed response."""
+    resp = requests.post(f"{url}/process_file", files={"file": (name, payload)},
+                         headers={"Accept": FRAMES_MIME}, stream=True, timeout=600)
+    resp.raise_for_status()
+    resp.raw.decode_content = True
+    meta, blobs = read_frames(resp.raw)
+    for _ in blobs:  # drain the ciphertexts like a real client would
+        pass
+    return meta["results"]
+
+
+def run_workload(url, args, payloads, rng):
+    """Open-loop arrivals; returns the report of one balancer."""
+    sizes = [s for s, _ in args.sizes]
+    weights = [w for _, w in args.sizes]
+    arrivals = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(args.rate)
+        if t >= args.duration:
+            break
+        arrivals.append((t, rng.choices(sizes, weights)[0]))
+
+    lock = threading.Lock()
+    latencies, distribution = [], {}
+    stats = {"files": 0, "errors": 0, "bytes": 0, "failed_chunks": 0}
+
+    def one(i, planned, size):
+        try:
+            results = upload(url, f"bench{i}.bin", payloads[size])
+        except Exception as e:
+            with lock:
+                stats["errors"] += 1
+                stats.setdefault("last_error", str(e))
+            return
+        done = time.time()
+        with lock:
+            latencies.append(done - planned)
+            stats["files"] += 1
+            stats["bytes"] += size
+            for r in results:
+                if r.get("error"):
+                    stats["failed_chunks"] += 1
+                else:
+                    node = str(r["node_used"])
+                    distribution[node] = distribution.get(node, 0) + 1
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, (offset, size) in enumerate(arrivals):
+            time.sleep(max(0.0, start + offset - time.time()))
+            pool.submit(one, i, start + offset, size)
+    elapsed = time.time() - start
+
+    return dict(stats, **{
+        "offered": len(arrivals),
+        "elapsed": elapsed,
+        "throughput_mbps": stats["bytes"] / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "latency": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "node_distribution": dict(sorted(distribution.items())),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fog load balancers")
+    parser.add_argument("--balancers", default="random,round_robin,algo")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--node-kind", choices=["real", "stub"], default="real")
+    parser.add_argument("--base-port", type=int, default=5101)
+    parser.add_argument("--stub-latency", default="0.005", help="s per call, one per node")
+    parser.add_argument("--stub-mbps", default="100", help="MB/s per call, one per node")
+    parser.add_argument("--stub-slots", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="file arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="s of arrivals")
+    parser.add_argument("--sizes", type=parse_mix, default=parse_mix("1M:5,10M:3,50M:1"))
+    parser.add_argument("--content", choices=["text", "random"], default="text")
+    parser.add_argument("--concurrency", type=int, default=8, help="max uploads at once")
+    parser.add_argument("--warmup", type=int, default=3, help="files sent before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE for all processes")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+    args.env = dict(e.split("=", 1) for e in args.env)
+
+    make = generate_file.make_text if args.content == "text" else os.urandom
+    payloads = {size: make(size) for size, _ in args.sizes}
+    report = {"config": {k: v for k, v in vars(args).items()}, "balancers": {}}
+
+    log_dir = tempfile.mkdtemp(prefix="fog-bench-")
+    for name in args.balancers.split(","):
+        cluster = Cluster(args, name, log_dir)
+        print(f"[bench] {name}: starting {args.nodes} {args.node_kind} nodes", file=sys.stderr)
+        try:
+            cluster.start()
+            smallest = min(payloads)
+            for i in range(args.warmup):
+                upload(cluster.url, f"warmup{i}.bin", payloads[smallest])
+            result = run_workload(cluster.url, args, payloads, random.Random(args.seed))
+        finally:
+            cluster.stop()
+        report["balancers"][name] = result
+        lat = result["latency"]
+        print(f"[bench] {name}: {result['throughput_mbps']:.1f} MB/s, p50 {lat['p50']}, "
+              f"p99 {lat['p99']}, {result['errors']} errors", file=sys.stderr)
+    report["logs"] = log_dir
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
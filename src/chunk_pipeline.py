@@ -0,0 +1,141 @@
+# chunk_pipeline.py → What happens to one chunk between a dispatcher worker and its result
+#
+# Shared by the three load balancers, which differ only in how they pick a node:
+#   dedup lookup → compression → node selection → /task (batched, hedged, timed) →
+#   retry on the next node after a failure or a 503 → result entry (and dedup store)
+#
+# A balancer passes its selection as callbacks:
+#   acquire(job, idx, size, tried) → node for the chunk, or None if none is free right now
+#       (the pipeline then waits for nodes backing off after a 503, or gives up once every
+#       node is tried or ejected); `size` is the chunk's plaintext bytes
+#   alternate(size, exclude)       → node for a hedged copy of a straggler, or None
+# and, if it reserves node slots itself, release(node) once a call on that node is over.
+# Otherwise each request holds one of the dispatcher's per-node slots (node_slot).
+import time
+from contextlib import nullcontext
+
+import lb_metrics
+from batching import ChunkTask, TaskBatcher, post_tasks
+from chunk_transport import NodeBusy
+
+
+class ChunkPipeline:
+    def __init__(self, name, breakers, sizer, hedger, compressor, dedup, acquire, alternate,
+                 node_slot=None, release=None, on_success=None):
+        self.name = name
+        self.breakers = breakers
+        self.sizer = sizer
+        self.hedger = hedger
+        self.compressor = compressor
+        self.dedup = dedup
+        self.acquire = acquire
+        self.alternate = alternate
+        self.node_slot = node_slot
+        self.release = release
+        self.on_success = on_success  # on_success(node, data, seconds) after a good answer
+        self.batcher = TaskBatcher(self.send_request)  # chunks headed to the same node share requests
+
+    def send_request(self, node, tasks, convergent):
+        """One /task or /task_batch request (see batching.py)."""
+        with self.node_slot(node) if self.node_slot else nullcontext():
+            start = time.time()
+            try:
+                results = post_tasks(node, tasks, convergent)
+            except NodeBusy as e:
+                self.breakers.record_busy(node, e.retry_after)
+                raise
+            except Exception as e:
+                self.breakers.record_failure(node, type(e).__name__)
+                raise
+            elapsed = time.time() - start
+            lb_metrics.node_request_seconds.labels(node=node).observe(elapsed)
+            self.breakers.record_success(node, elapsed / len(tasks))
+            self.sizer.observe(node, sum(t.size for t in tasks), elapsed)  # plaintext bytes, as planned
+            return results
+
+    def send(self, node, task, convergent):
+        try:
+            return self.batcher.send(node, task, convergent)
+        finally:
+            if self.release is not None:
+                self.release(node)
+
+    def process_chunk(self, job, idx, chunk):
+        start_time = time.time()
+        trace = job.chunk_trace(idx)
+        trace.lap("lb_queue")
+        salt = self.dedup.salt(job.tenant)
+        cache_key, cached = self.dedup.lookup(salt, chunk)
+        trace.lap("dedup")
+        if cached is not None:
+            # Same chunk already encrypted (convergent mode): no node involved
+            return job.add_result(dict(cached, chunk=idx, processing_time=0,
+                                       total_time=time.time() - start_time, hedged=False,
+                                       dedup=True, trace=trace.as_dict()))
+        try:
+            entry = self._encrypt(job, idx, chunk, salt, trace, start_time)
+        except Exception:
+            self.dedup.store(cache_key, None)  # never leave same-content chunks waiting
+            raise
+        self.dedup.store(cache_key, entry)
+        return job.add_result(entry)
+
+    def _encrypt(self, job, idx, chunk, salt, trace, start_time):
+        """Result entry of a chunk that was not in the dedup cache."""
+        size = len(chunk)  # node models and chunk sizing count plaintext bytes, whatever the codec
+        codec, payload = self.compressor.compress_chunk(chunk)
+        trace.lap("compress")
+        tried = set()
+        node = data = None
+        hedged = False
+
+        # A failed chunk is re-sent to the next healthy node until every node has been tried
+        while data is None:
+            candidate = self.acquire(job, idx, size, tried)
+            if candidate is None:
+                wait = self.breakers.retry_in(exclude=tried)
+                if wait is None:
+                    break
+                time.sleep(max(wait, 0.01))  # every node left is shedding load: honour Retry-After
+                trace.lap("retry")
+                continue
+            node = candidate
+            trace.lap("select")
+            call_start = time.time()
+            try:
+                winner, data = self.hedger.call(
+                    node, lambda n: self.send(n, ChunkTask(payload, trace.header(), size), salt),
+                    lambda: self.alternate(size, tried | {node}))
+            except NodeBusy:
+                trace.lap("retry")
+                continue  # shed by the node (503): it backs off, the chunk goes elsewhere
+            except Exception as e:
+                trace.lap("retry")
+                tried.add(node)
+                print(f"[{self.name}] Error on node {node}: {e}")
+                continue
+            hedged = winner != node
+            node = winner
+            trace.call(data)
+            if self.on_success is not None:
+                self.on_success(node, data, time.time() - call_start)
+
+        port = node.split(":")[-1] if node else 0
+        if data is None:
+            data = {"result": None, "key": None, "nonce": None, "processing_time": 0,
+                    "error": "all nodes failed" if tried else "no healthy node"}
+        entry = {
+            "chunk": idx,
+            "node_used": int(data.get("node_used", port)),
+            "result": data.get("result"),           # encrypted chunk (bytes)
+            "key": data.get("key"),                 # CRITICAL: forward encryption key
+            "nonce": data.get("nonce"),             # CRITICAL: forward nonce
+            "processing_time": data.get("processing_time", 0),
+            "total_time": time.time() - start_time,
+            "hedged": hedged,
+            "codec": codec,
+            "trace": trace.as_dict()
+        }
+        if "error" in data:
+            entry["error"] = data["error"]
+        return entry
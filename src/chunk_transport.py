@@ -0,0 +1,254 @@
+# chunk_transport.py → Binary chunk transport shared by fog nodes, load balancers and client
+#
+# Fog node /task (Accept: application/octet-stream):
+#   body    = raw ciphertext
+#   headers = X-Nonce, X-Key (hex), X-Processing-Time, X-Node-Used
+#   503 when the node's task queue is full: Retry-After (s), X-Retry-After-Ms, X-Queue-Depth
+#
+# Fog node /task_batch (Content-Type: application/x-fog-batch), several chunks in one call:
+#   request  = [4 bytes big-endian length][chunk 0][length][chunk 1]...
+#   response = same layout as the /process_file frames below: a JSON header whose
+#              "results" hold nonce, key, processing_time and length per chunk, then the
+#              ciphertexts in request order. 503s as for /task.
+#
+# Convergent mode (see dedup.py): with an X-Convergent-Salt header (hex) on /task or
+# /task_batch, the node derives key and nonce from each chunk and the salt
+# (convergent_key) instead of drawing them at random, so identical chunks of a tenant
+# give identical ciphertexts.
+#
+# Load balancer /process_file (Accept: application/x-fog-frames):
+#   [4 bytes big-endian header length][JSON header][ciphertext chunk 0][chunk 1]...
+#   The JSON header carries the usual "results" list without "result";
+#   each entry has a "length" giving the size of its ciphertext in the payload.
+#
+# Callers that do not ask for these types keep getting the hex-in-JSON bodies.
+import hashlib
+import hmac
+import json
+import os
+import struct
+import tempfile
+import threading
+
+CHUNK_MIME = "application/octet-stream"
+FRAMES_MIME = "application/x-fog-frames"
+BATCH_MIME = "application/x-fog-batch"
+JSON_MIME = "application/json"
+CONVERGENT_HEADER = "X-Convergent-Salt"
+
+_HEADER_LEN = struct.Struct("!I")
+
+SPOOL_MEMORY = int(os.environ.get("SPOOL_MEMORY", str(32 * 1024 * 1024)))
+
+
+def wants(req, mimetype):
+    """True if the Flask request prefers `mimetype` over JSON (content negotiation)."""
+    return req.accept_mimetypes.best_match([JSON_MIME, mimetype]) == mimetype
+
+
+# ---------- fog node <-> load balancer ----------
+
+def task_headers(nonce, key, processing_time, node_used):
+    return {
+        "X-Nonce": nonce.hex(),
+        "X-Key": key.hex(),
+        "X-Processing-Time": repr(processing_time),
+        "X-Node-Used": str(node_used),
+    }
+
+
+def convergent_key(salt, chunk):
+    """(key, nonce) of a chunk in convergent mode. A nonce only repeats with its key for the
+    same plaintext, where AES-GCM then simply produces the same ciphertext again."""
+    digest = hmac.new(salt, chunk, hashlib.sha256).digest()
+    return digest[:16], digest[16:28]
+
+
+def convergent_salt(req):
+    """Salt of a convergent-mode request (None otherwise); ValueError if it is not hex."""
+    salt = req.headers.get(CONVERGENT_HEADER)
+    return bytes.fromhex(salt) if salt else None
+
+
+class NodeBusy(Exception):
+    """The fog node shed the task (503): route it elsewhere, or retry after `retry_after` s."""
+
+    def __init__(self, retry_after, queue_depth=0):
+        super().__init__(f"node busy (queue depth {queue_depth}, retry in {retry_after:.2f}s)")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+def busy_headers(retry_after, queue_depth):
+    return {
+        "Retry-After": str(max(1, int(retry_after + 0.999))),  # HTTP wants whole seconds
+        "X-Retry-After-Ms": str(int(retry_after * 1000)),
+        "X-Queue-Depth": str(queue_depth),
+    }
+
+
+def _check_status(resp):
+    """NodeBusy on a 503, requests' HTTPError on any other error status."""
+    if resp.status_code == 503:
+        h = resp.headers
+        if "X-Retry-After-Ms" in h:
+            retry_after = int(h["X-Retry-After-Ms"]) / 1000
+        else:
+            retry_after = float(h.get("Retry-After", 1))
+        raise NodeBusy(retry_after, int(h.get("X-Queue-Depth", 0)))
+    resp.raise_for_status()
+
+
+def decode_task_response(resp):
+    """Parse a /task response (binary or JSON) into a dict; "result" is returned as bytes.
+
+    Raises NodeBusy on a 503 and requests' HTTPError on any other error status.
+    """
+    _check_status(resp)
+    if resp.headers.get("Content-Type", "").startswith(CHUNK_MIME):
+        h = resp.headers
+        return {
+            "result": resp.content,
+            "nonce": h["X-Nonce"],
+            "key": h["X-Key"],
+            "processing_time": float(h.get("X-Processing-Time", 0)),
+            "node_used": int(h["X-Node-Used"]),
+        }
+    data = resp.json()
+    data["result"] = bytes.fromhex(data["result"])
+    return data
+
+
+def encode_batch(chunks):
+    """/task_batch request body."""
+    return b"".join(_HEADER_LEN.pack(len(c)) + c for c in chunks)
+
+
+def decode_batch(body):
+    """Chunks of a /task_batch request body (memoryviews into `body`); ValueError if cut short."""
+    view = memoryview(body)
+    chunks = []
+    pos = 0
+    while pos < len(view):
+        if pos + _HEADER_LEN.size > len(view):
+            raise ValueError("truncated batch")
+        (length,) = _HEADER_LEN.unpack_from(view, pos)
+        pos += _HEADER_LEN.size
+        if pos + length > len(view):
+            raise ValueError("truncated batch")
+        chunks.append(view[pos:pos + length])
+        pos += length
+    return chunks
+
+
+def batch_response_body(results, node_used):
+    """/task_batch response body from (ciphertext, nonce, key, processing_time) per chunk."""
+    entries = [{"nonce": nonce.hex(), "key": key.hex(), "processing_time": processing_time,
+                "length": len(ciphertext)} for ciphertext, nonce, key, processing_time in results]
+    header = json.dumps({"node_used": node_used, "results": entries}).encode()
+    return b"".join([_HEADER_LEN.pack(len(header)), header] + [r[0] for r in results])
+
+
+def decode_batch_response(resp):
+    """Parse a /task_batch response into one decode_task_response-style dict per chunk."""
+    _check_status(resp)
+    body = memoryview(resp.content)
+    (size,) = _HEADER_LEN.unpack_from(body, 0)
+    pos = _HEADER_LEN.size + size
+    meta = json.loads(bytes(body[_HEADER_LEN.size:pos]))
+    results = []
+    for entry in meta["results"]:
+        length = entry.pop("length")
+        results.append(dict(entry, result=bytes(body[pos:pos + length]),
+                            node_used=meta["node_used"]))
+        pos += length
+    return results
+
+
+# ---------- load balancer <-> client ----------
+
+class ResultSpool:
+    """Ciphertexts of one upload, kept in memory up to SPOOL_MEMORY bytes then spilled to a temp file.
+
+    Workers add() results in completion order; the response reads them back in chunk order.
+    """
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        """Move entry["result"] into the spool and return the (metadata-only) entry."""
+        data = entry.pop("result", None)
+        if data is not None:
+            with self.lock:
+                self.file.seek(0, os.SEEK_END)
+                self.index[entry["chunk"]] = (self.file.tell(), len(data))
+                self.file.write(data)
+        return entry
+
+    def length(self, chunk):
+        return self.index.get(chunk, (0, 0))[1]
+
+    def read(self, chunk):
+        if chunk not in self.index:
+            return None
+        offset, length = self.index[chunk]
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+
+def iter_frames(meta, results, spool):
+    """Yield the framed body for `meta` + `results`, reading ciphertexts back from `spool`."""
+    try:
+        entries = [dict(r, length=spool.length(r["chunk"])) for r in results]
+        header = json.dumps(dict(meta, results=entries)).encode()
+        yield _HEADER_LEN.pack(len(header)) + header
+        for r in entries:
+            if r["length"]:
+                yield spool.read(r["chunk"])
+    finally:
+        spool.close()
+
+
+def results_as_json(results, spool):
+    """Hex-encode ciphertexts for the legacy JSON body."""
+    try:
+        out = []
+        for r in results:
+            data = spool.read(r["chunk"])
+            out.append(dict(r, result=data.hex() if data is not None else None))
+        return out
+    finally:
+        spool.close()
+
+
+def _read_exact(fp, n):
+    buf = bytearray()
+    while len(buf) < n:
+        part = fp.read(n - len(buf))
+        if not part:
+            raise EOFError(f"truncated frame: expected {n} bytes, got {len(buf)}")
+        buf += part
+    return bytes(buf)
+
+
+def read_frames(fp):
+    """Read a framed body from file-like `fp`.
+
+    Returns (meta, blobs) where `blobs` lazily yields (entry, ciphertext) in payload order,
+    so the caller can write ciphertexts to disk without holding the whole body.
+    """
+    (size,) = _HEADER_LEN.unpack(_read_exact(fp, _HEADER_LEN.size))
+    meta = json.loads(_read_exact(fp, size))
+
+    def blobs():
+        for entry in meta["results"]:
+            yield entry, _read_exact(fp, entry["length"]) if entry["length"] else None
+
+    return meta, blobs()
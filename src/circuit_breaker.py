@@ -0,0 +1,188 @@
+# circuit_breaker.py → Per-node circuit breakers and latency outlier ejection
+#
+#   closed     normal traffic; BREAKER_FAILURES consecutive failures → open
+#   open       node is skipped by the balancers; a background prober calls /health once
+#              the cool-down is over and moves the node to half-open when it answers
+#   half-open  traffic allowed on probation: BREAKER_RECOVERY successes → closed,
+#              any failure → open again with twice the cool-down (up to BREAKER_MAX_OPEN)
+#
+# A closed node whose latency EWMA is OUTLIER_FACTOR times the median of the other closed
+# nodes is ejected as well (at most MAX_EJECTED_FRACTION of the nodes for latency reasons).
+#
+# A node that sheds a task (503 from its admission control) is not failing: it is only
+# skipped until its Retry-After (capped at BUSY_MAX_BACKOFF) has passed.
+import os
+import statistics
+import threading
+import time
+
+import http_pool
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "3"))
+BREAKER_OPEN_TIME = float(os.environ.get("BREAKER_OPEN_TIME", "5"))     # s, first cool-down
+BREAKER_MAX_OPEN = float(os.environ.get("BREAKER_MAX_OPEN", "60"))      # s
+BREAKER_RECOVERY = int(os.environ.get("BREAKER_RECOVERY", "2"))         # successes to close
+BREAKER_PROBE_INTERVAL = float(os.environ.get("BREAKER_PROBE_INTERVAL", "1"))
+OUTLIER_FACTOR = float(os.environ.get("OUTLIER_FACTOR", "3"))
+OUTLIER_MIN_SAMPLES = int(os.environ.get("OUTLIER_MIN_SAMPLES", "5"))
+MAX_EJECTED_FRACTION = float(os.environ.get("MAX_EJECTED_FRACTION", "0.5"))
+BUSY_MAX_BACKOFF = float(os.environ.get("BUSY_MAX_BACKOFF", "5"))      # s
+EWMA_ALPHA = 0.3
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class NodeBreaker:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0          # consecutive
+        self.successes = 0         # consecutive, counted while half-open
+        self.open_time = BREAKER_OPEN_TIME
+        self.opened_at = None
+        self.reason = None
+        self.trips = 0
+        self.latency = None        # EWMA of successful calls (s)
+        self.samples = 0
+        self.busy_until = 0.0      # node asked us to back off until then
+        self.sheds = 0
+
+
+class BreakerBoard:
+    """Circuit breakers for the balancer's fog nodes, with a background /health prober."""
+
+    def __init__(self, nodes, name="LB"):
+        self.name = name
+        self.nodes = list(nodes)
+        self.breakers = {n: NodeBreaker() for n in self.nodes}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._probe_loop, name="breaker-probe", daemon=True).start()
+
+    def add_node(self, node):
+        with self.lock:
+            self.breakers[node] = NodeBreaker()  # a (re)joining node starts closed
+            if node not in self.nodes:
+                self.nodes.append(node)
+
+    def remove_node(self, node):
+        # the breaker object stays: calls still in flight on the node may report back
+        with self.lock:
+            if node in self.nodes:
+                self.nodes.remove(node)
+
+    def allow(self, node):
+        """True unless the node is ejected (open) or backing off after a 503.
+
+        A node without a breaker (not added yet) is not used."""
+        b = self.breakers.get(node)
+        return b is not None and b.state != OPEN and b.busy_until <= time.time()
+
+    def available(self, nodes=None):
+        return [n for n in list(nodes or self.nodes) if self.allow(n)]
+
+    def unavailable(self):
+        return [n for n in list(self.nodes) if not self.allow(n)]
+
+    def retry_in(self, exclude=()):
+        """Seconds until a backing-off node (not in `exclude`, not open) takes tasks again.
+
+        0 if such a node is usable right now, None if there is none at all.
+        """
+        now = time.time()
+        waits = []
+        for node in list(self.nodes):
+            b = self.breakers[node]
+            if node not in exclude and b.state != OPEN:
+                waits.append(max(b.busy_until - now, 0))
+        return min(waits) if waits else None
+
+    def record_busy(self, node, retry_after):
+        with self.lock:
+            b = self.breakers[node]
+            b.busy_until = time.time() + min(retry_after, BUSY_MAX_BACKOFF)
+            b.sheds += 1
+
+    def record_success(self, node, seconds):
+        with self.lock:
+            b = self.breakers[node]
+            b.failures = 0
+            b.latency = seconds if b.latency is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * b.latency
+            b.samples += 1
+            if b.state == HALF_OPEN:
+                b.successes += 1
+                if b.successes >= BREAKER_RECOVERY:
+                    self._close(node, b)
+            elif b.state == CLOSED and self._is_outlier(node, b):
+                self._open(node, b, f"latency outlier ({b.latency:.2f}s)")
+
+    def record_failure(self, node, reason="error"):
+        with self.lock:
+            b = self.breakers[node]
+            b.failures += 1
+            if b.state == HALF_OPEN:
+                b.open_time = min(b.open_time * 2, BREAKER_MAX_OPEN)
+                self._open(node, b, reason)
+            elif b.state == CLOSED and b.failures >= BREAKER_FAILURES:
+                self._open(node, b, f"{b.failures} consecutive failures ({reason})")
+
+    def _is_outlier(self, node, b):
+        if b.samples < OUTLIER_MIN_SAMPLES:
+            return False
+        peers = [self.breakers[n] for n in self.nodes if n != node]
+        others = [o.latency for o in peers if o.state == CLOSED and o.samples >= OUTLIER_MIN_SAMPLES]
+        if not others or b.latency <= OUTLIER_FACTOR * statistics.median(others):
+            return False
+        ejected = sum(o.state != CLOSED for o in peers)
+        return ejected + 1 <= MAX_EJECTED_FRACTION * len(self.nodes)
+
+    def _open(self, node, b, reason):
+        b.state = OPEN
+        b.opened_at = time.time()
+        b.reason = reason
+        b.trips += 1
+        b.successes = 0
+        print(f"[{self.name}] Circuit OPEN for {node}: {reason} (retry in {b.open_time:.0f}s)")
+
+    def _close(self, node, b):
+        b.state = CLOSED
+        b.failures = b.successes = 0
+        b.open_time = BREAKER_OPEN_TIME
+        b.reason = None
+        b.latency, b.samples = None, 0  # judge the recovered node on fresh latencies
+        print(f"[{self.name}] Circuit CLOSED for {node}")
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(BREAKER_PROBE_INTERVAL)
+            now = time.time()
+            for node in list(self.nodes):
+                b = self.breakers[node]
+                if b.state != OPEN or now - b.opened_at < b.open_time:
+                    continue
+                try:
+                    http_pool.get(f"{node}/health", timeout=1.5).raise_for_status()
+                except Exception:
+                    with self.lock:
+                        b.opened_at = time.time()  # still down: wait another cool-down
+                    continue
+                with self.lock:
+                    if b.state == OPEN:
+                        b.state = HALF_OPEN
+                        print(f"[{self.name}] Circuit HALF-OPEN for {node}")
+
+    def stats(self):
+        now = time.time()
+        stats = {}
+        with self.lock:
+            for node in self.nodes:
+                b = self.breakers[node]
+                stats[node] = {
+                    "state": b.state,
+                    "consecutive_failures": b.failures,
+                    "trips": b.trips,
+                    "reason": b.reason,
+                    "sheds": b.sheds,
+                    "busy_for": round(max(b.busy_until - now, 0), 3),
+                    "open_for": round(now - b.opened_at, 3) if b.state == OPEN else None,
+                    "latency_ewma": round(b.latency, 3) if b.latency is not None else None,
+                }
+        return stats
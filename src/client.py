@@ -1,13 +1,20 @@
 # frontend_lb.py
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
-import requests, os, json
+from flask import Flask, request, jsonify, render_template_string, send_from_directory, Response
+import os, json, time
+import http_pool
+from chunk_transport import FRAMES_MIME, read_frames
+from upload_stream import iter_body
+from fog_container import ContainerWriter, ContainerError, load_kek
+from tracing import TRACE_HEADER, chrome_trace, new_trace_id, traceparent
+from decrypt import decrypt_file
+from werkzeug.utils import safe_join
 
 app = Flask(__name__)
 
-UPLOAD_FOLDER = "uploads_client"
 ENCRYPTED_FOLDER = "encrypted"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+DECRYPTED_FOLDER = "decrypted"
 os.makedirs(ENCRYPTED_FOLDER, exist_ok=True)
+os.makedirs(DECRYPTED_FOLDER, exist_ok=True)
 
 LB_URLS = {
     "random": "http://127.0.0.1:5005",
@@ -15,7 +22,18 @@ LB_URLS = {
     "round_robin": "http://127.0.0.1:5007"
 }
 
-CHUNK_SIZE = 5 * 1024 * 1024  # 5 MB
+CONTAINER_KEK = load_kek()  # optional: wraps the chunk keys stored in .enc containers
+
+# Every file is one trace; with TRACE_DIR set, its chunk timings are also written there as
+# <file>.trace.json (Chrome trace format: chrome://tracing or ui.perfetto.dev)
+TRACE_DIR = os.environ.get("TRACE_DIR")
+
+# Tenant of this client's uploads (X-Tenant): scopes the balancers' dedup cache
+TENANT = os.environ.get("TENANT")
+TENANT_HEADERS = {"X-Tenant": TENANT} if TENANT else {}
+
+# Async jobs started from the page: job id -> load balancer URL
+client_jobs = {}
 
 HTML_PAGE = """
 <!DOCTYPE html>
@@ -46,7 +64,7 @@ HTML_PAGE = """
             font-size:14px; 
             text-align:center;
         }
-        #downloadBtn {display:none; background:linear-gradient(135deg,#11998e,#38ef7d); margin-top:20px;}
+        #downloadBtn, #decryptBtn {display:none; background:linear-gradient(135deg,#11998e,#38ef7d); margin-top:20px;}
     </style>
 </head>
 <body>
@@ -66,7 +84,7 @@ HTML_PAGE = """
     <div id="status" style="text-align:center; font-weight:bold; margin:15px 0;"></div>
 
     <h3>Résultats des Chunks</h3>
-    <table><thead><tr><th>Chunk</th><th>Nœud</th><th>Traitement (s)</th><th>Total (s)</th></tr></thead><tbody id="results"></tbody></table>
+    <table><thead><tr><th>Chunk</th><th>Nœud</th><th>Traitement (s)</th><th>Total (s)</th><th>Étapes (ms)</th></tr></thead><tbody id="results"></tbody></table>
 
     <h3 style="margin-top:30px;">Métriques des Nœuds Fog</h3>
     <table><thead><tr><th>Port</th><th>CPU %</th><th>RAM %</th><th>Tâches</th></tr></thead><tbody id="metrics"></tbody></table>
@@ -75,6 +93,9 @@ HTML_PAGE = """
         <button id="downloadBtn" onclick="window.location.href=document.getElementById('encLink').href">
             Télécharger le fichier chiffré (.enc)
         </button>
+        <button id="decryptBtn" onclick="decryptFile()">
+            Déchiffrer et télécharger
+        </button>
         <a id="encLink" style="display:none;"></a>
     </div>
 </div>
@@ -88,36 +109,97 @@ async function uploadFile() {
     form.append("file", file);
     form.append("lb_type", lbType);
 
-    document.getElementById("status").innerText = "Envoi et chiffrement en cours...";
+    const status = document.getElementById("status");
+    status.innerText = "Envoi et chiffrement en cours...";
+    document.getElementById("results").innerHTML = "";
+    document.getElementById("downloadBtn").style.display = "none";
+    document.getElementById("decryptBtn").style.display = "none";
 
     try {
-        const res = await fetch("/send_file", {method: "POST", body: form});
-        const data = await res.json();
+        // 1. Create the job, 2. follow its events, 3. upload (rows appear while it runs)
+        const res = await fetch(`/jobs?lb_type=${encodeURIComponent(lbType)}`, {method: "POST"});
+        const job = await res.json();
+        if (job.error) throw job.error;
+        followJob(job.job_id, file.name);
+
+        const up = await fetch(`/send_file?lb_type=${encodeURIComponent(lbType)}&job_id=${job.job_id}`,
+                               {method: "POST", body: form});
+        const data = await up.json();
         if (data.error) throw data.error;
+    } catch (e) {
+        status.innerText = "Erreur : " + e;
+    }
+}
 
-        document.getElementById("status").innerText = `Chiffrement terminé ! ${data.results.length} chunks traités.`;
-        displayResults(data.results);
+function followJob(jobId, fileName) {
+    const status = document.getElementById("status");
+    const events = new EventSource(`/events/${jobId}`);
+    events.addEventListener("chunk", e => addResultRow(JSON.parse(e.data)));
+    events.addEventListener("progress", e => {
+        const p = JSON.parse(e.data);
+        status.innerText = `Chiffrement en cours... ${p.chunks_done}/${p.chunks_received} chunks traités.`;
+    });
+    events.addEventListener("saved", e => {
+        const data = JSON.parse(e.data);
+        events.close();
+        status.innerText = `Chiffrement terminé ! ${data.chunks} chunks traités.` + traceSummary(data.trace);
         document.getElementById("encLink").href = data.encrypted_file_url;
-        document.getElementById("encLink").download = file.name + ".enc";
+        document.getElementById("encLink").download = fileName + ".enc";
         document.getElementById("downloadBtn").style.display = "inline-block";
-    } catch (e) {
-        document.getElementById("status").innerText = "Erreur : " + e;
-    }
+        document.getElementById("decryptBtn").style.display = "inline-block";
+    });
+    events.addEventListener("failed", e => {
+        events.close();
+        const data = JSON.parse(e.data);
+        status.innerText = "Erreur : " + (data.error || "échec du job");
+    });
+    events.onerror = () => events.close();  // no automatic reconnect: it would replay every row
+}
+
+// The three longest stages of a chunk, e.g. "aes 41 · network 12 · lb_queue 3"
+function topStages(stages) {
+    return Object.entries(stages || {}).sort((a, b) => b[1] - a[1]).slice(0, 3)
+        .map(([name, s]) => `${name} ${(s * 1000).toFixed(0)}`).join(" · ");
 }
 
-function displayResults(results) {
+function traceSummary(trace) {
+    if (!trace) return "";
+    const slowest = trace.slowest_chunk ? ` Chunk le plus lent : ${trace.slowest_chunk.chunk} (${topStages(trace.slowest_chunk.stages)}).` : "";
+    return ` ${trace.wall.toFixed(2)} s, trace ${trace.trace_id}.${slowest}`;
+}
+
+function addResultRow(r) {
     const tbody = document.getElementById("results");
-    tbody.innerHTML = "";
-    results.forEach(r => {
-        const tr = document.createElement("tr");
-        tr.innerHTML = `<td>${r.chunk}</td><td>${r.node_used}</td><td>${r.processing_time.toFixed(3)}</td><td>${r.total_time.toFixed(3)}</td>`;
-        tbody.appendChild(tr);
-    });
+    const tr = document.createElement("tr");
+    const stages = topStages(r.trace && r.trace.stages);
+    if (r.error) {
+        tr.innerHTML = `<td>${r.chunk}</td><td colspan="3">${r.error}</td><td>${stages}</td>`;
+    } else {
+        tr.innerHTML = `<td>${r.chunk}</td><td>${r.node_used}</td><td>${r.processing_time.toFixed(3)}</td><td>${r.total_time.toFixed(3)}</td><td>${stages}</td>`;
+    }
+    // keep rows in chunk order even though chunks finish out of order
+    const next = [...tbody.children].find(row => Number(row.firstChild.textContent) > r.chunk);
+    tbody.insertBefore(tr, next || null);
+}
+
+async function decryptFile() {
+    const status = document.getElementById("status");
+    const encName = document.getElementById("encLink").href.split("/").pop();
+    status.innerText = "Déchiffrement en cours...";
+    try {
+        const res = await fetch(`/decrypt/${encName}`, {method: "POST"});
+        const data = await res.json();
+        if (data.error) throw data.error;
+        status.innerText = `Déchiffrement terminé : ${data.chunks} chunks, ${data.mb_per_s.toFixed(1)} MB/s.`;
+        window.location.href = data.decrypted_file_url;
+    } catch (e) {
+        status.innerText = "Erreur : " + e;
+    }
 }
 
 async function getMetrics() {
     try {
-        const res = await fetch("/metrics");
+        const res = await fetch("/node_metrics");
         const nodes = await res.json();
         const tbody = document.getElementById("metrics");
         tbody.innerHTML = "";
@@ -148,64 +230,165 @@ getMetrics();
 def index():
     return render_template_string(HTML_PAGE)
 
+def save_frames(resp):
+    """Write a framed /process_file or /jobs/<id>/result body to ENCRYPTED_FOLDER.
+
+    The .enc file is an indexed container (fog_container.py) holding the ciphertexts
+    and, per chunk, its nonce, key and offsets. Returns (filename, header) where header
+    holds the per-chunk results without ciphertexts.
+    """
+    # Ciphertexts arrive as raw frames in chunk order: write them straight to disk
+    resp.raw.decode_content = True
+    result, blobs = read_frames(resp.raw)
+    filename = os.path.basename(result["file_name"])
+    encrypted_path = os.path.join(ENCRYPTED_FOLDER, filename + ".enc")
+    start = time.time()
+    # Balancers size chunks per file: the boundaries come with each entry
+    with ContainerWriter(encrypted_path, chunk_size=None, kek=CONTAINER_KEK) as out:
+        for entry, ciphertext in blobs:
+            if ciphertext:
+                out.add_chunk(entry["chunk"], bytes.fromhex(entry["nonce"]),
+                              bytes.fromhex(entry["key"]), ciphertext,
+                              plain_offset=entry.get("offset"), plain_length=entry.get("size"),
+                              codec=entry.get("codec", "raw"))
+    trace = result.get("trace")
+    if trace is not None:
+        trace["reassembly"] = time.time() - start
+        if TRACE_DIR:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(os.path.join(TRACE_DIR, filename + ".trace.json"), "w") as f:
+                json.dump(chrome_trace(result["results"], trace), f)
+    return filename, result
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    lb_type = request.args.get("lb_type", "random")
+    lb_url = LB_URLS.get(lb_type, LB_URLS["random"])
+    try:
+        resp = http_pool.post(f"{lb_url}/jobs", timeout=10,
+                              headers={TRACE_HEADER: traceparent(new_trace_id()), **TENANT_HEADERS})
+        resp.raise_for_status()
+        job_id = resp.json()["job_id"]
+    except Exception as e:
+        return jsonify({"error": f"Load balancer error: {str(e)}"}), 500
+    client_jobs[job_id] = lb_url
+    return jsonify({"job_id": job_id}), 201
+
 @app.route("/send_file", methods=["POST"])
 def send_file():
-    if "file" not in request.files:
+    if request.mimetype != "multipart/form-data":
         return jsonify({"error": "Aucun fichier"}), 400
 
-    file = request.files["file"]
-    filename = file.filename
-    temp_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(temp_path)
-
-    lb_type = request.form.get("lb_type", "random")
+    # lb_type travels in the query string: the form body is forwarded untouched
+    lb_type = request.args.get("lb_type", "random")
     lb_url = LB_URLS.get(lb_type, LB_URLS["random"])
+    job_id = request.args.get("job_id")
+    if job_id is not None:
+        if job_id not in client_jobs:
+            return jsonify({"error": "Job inconnu"}), 404
+        lb_url = client_jobs[job_id]
 
     try:
-        with open(temp_path, "rb") as f:
-            files = {"file": (filename, f)}
-            data = {"lb_type": lb_type}
-            resp = requests.post(f"{lb_url}/process_file", files=files, data=data, timeout=300)
+        # The browser's multipart body is piped to the balancer as it arrives (no temp file)
+        with http_pool.post(f"{lb_url}/process_file", data=iter_body(request.stream), timeout=300,
+                            params={"job_id": job_id} if job_id else None,
+                            headers={"Accept": FRAMES_MIME, "Content-Type": request.content_type,
+                                     TRACE_HEADER: traceparent(new_trace_id()),
+                                     **TENANT_HEADERS,
+                                     # piped bodies are sent chunked: the size travels apart
+                                     "X-Upload-Size": str(request.content_length or "")},
+                            stream=True) as resp:
             resp.raise_for_status()
-            result = resp.json()
+            if job_id is not None:
+                # Async job: results are followed through /events/<job_id>
+                return jsonify({"job_id": job_id}), 202
+            filename, result = save_frames(resp)
     except Exception as e:
         return jsonify({"error": f"Load balancer error: {str(e)}"}), 500
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
-    encrypted_path = os.path.join(ENCRYPTED_FOLDER, filename + ".enc")
-    with open(encrypted_path, "wb") as out:
-        for chunk in sorted(result["results"], key=lambda x: x["chunk"]):
-            out.write(bytes.fromhex(chunk["result"]))
-
-    meta_path = os.path.join(ENCRYPTED_FOLDER, filename + ".meta.json")
-    with open(meta_path, "w") as mf:
-        json.dump({"chunks": [
-            {"chunk": r["chunk"], "key": r["key"], "nonce": r["nonce"]}
-            for r in result["results"]
-        ]}, mf, indent=2)
 
     return jsonify({
         "results": result["results"],
+        "trace": result.get("trace"),
         "encrypted_file_url": f"/download/{filename}.enc"
     })
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/events/<job_id>")
+def events(job_id):
+    """Relay the balancer's job events to the page, then save the result once the job is done."""
+    lb_url = client_jobs.get(job_id)
+    if lb_url is None:
+        return jsonify({"error": "Job inconnu"}), 404
+
+    def stream():
+        final = None
+        try:
+            with http_pool.get(f"{lb_url}/jobs/{job_id}/events", timeout=60, stream=True) as resp:
+                resp.raise_for_status()
+                buf = ""
+                for block in resp.iter_content(chunk_size=None, decode_unicode=True):
+                    buf += block
+                    while "\n\n" in buf:
+                        message, buf = buf.split("\n\n", 1)
+                        yield message + "\n\n"
+                        if message.startswith("event: done"):
+                            final = "done"
+                        elif message.startswith("event: failed"):
+                            final = "failed"
+                    if final:
+                        break
+            if final == "done":
+                with http_pool.get(f"{lb_url}/jobs/{job_id}/result", timeout=300, stream=True,
+                                   headers={"Accept": FRAMES_MIME}) as resp:
+                    resp.raise_for_status()
+                    filename, result = save_frames(resp)
+                yield sse("saved", {
+                    "chunks": len(result["results"]),
+                    "trace": result.get("trace"),
+                    "encrypted_file_url": f"/download/{filename}.enc"
+                })
+        except Exception as e:
+            yield sse("failed", {"error": f"Load balancer error: {str(e)}"})
+        finally:
+            client_jobs.pop(job_id, None)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.route("/download/<filename>")
 def download(filename):
     return send_from_directory(ENCRYPTED_FOLDER, filename, as_attachment=True)
 
-@app.route("/metrics")
-def metrics():
-    nodes = [
-        "http://172.20.10.2:5001",
-        "http://172.20.10.3:5002",
-        "http://172.20.10.6:5003",
-    ]
+@app.route("/decrypt/<filename>", methods=["POST"])
+def decrypt(filename):
+    """Decrypt an .enc container in parallel (every GCM tag checked) into DECRYPTED_FOLDER."""
+    src = safe_join(ENCRYPTED_FOLDER, filename)
+    if src is None or not filename.endswith(".enc") or not os.path.isfile(src):
+        return jsonify({"error": "Fichier chiffré introuvable"}), 404
+    name = filename[:-len(".enc")]
+    try:
+        stats = decrypt_file(src, os.path.join(DECRYPTED_FOLDER, name), kek=CONTAINER_KEK)
+    except ContainerError as e:
+        return jsonify({"error": f"Déchiffrement impossible : {e}"}), 422
+    stats["decrypted_file_url"] = f"/decrypted/{name}"
+    return jsonify(stats)
+
+@app.route("/decrypted/<filename>")
+def download_decrypted(filename):
+    return send_from_directory(DECRYPTED_FOLDER, filename, as_attachment=True)
+
+@app.route("/node_metrics")
+def node_metrics():
+    # Live fog nodes as registered with the smart balancer (see membership.py)
+    try:
+        nodes = [n["url"] for n in http_pool.get(f"{LB_URLS['algo']}/nodes", timeout=2).json()]
+    except Exception:
+        nodes = []
     data = []
     for url in nodes:
         try:
-            r = requests.get(f"{url}/health", timeout=2)
+            r = http_pool.get(f"{url}/health", timeout=2)
             r.raise_for_status()
             info = r.json()
             info["port"] = info.get("port", url.split(":")[-1])
@@ -214,5 +397,9 @@ def metrics():
             data.append({"port": url.split(":")[-1], "error": True})
     return jsonify(data)
 
+@app.route("/pool_stats")
+def pool_stats():
+    return jsonify(http_pool.pool_stats())
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=4000, debug=False)
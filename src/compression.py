@@ -0,0 +1,102 @@
+# compression.py → Optional compression of chunks before they are encrypted
+#
+# AES-GCM output does not compress, so the balancer compresses each chunk before sending
+# it to a fog node: fewer bytes on the wire both ways and a smaller .enc file. A chunk is
+# first sampled (a few slices at fast zlib level 1); if the sample does not shrink below
+# COMPRESS_MAX_RATIO the chunk is sent as is ("raw"), so random or already compressed
+# data costs a sample, not a full compression. The codec of each chunk travels in its
+# result entry and in the container index (decrypt.py decompresses after decryption).
+#
+#   COMPRESSION=off (default) | zlib | zlib:9 | lzma | lzma:3     codec[:level]
+import lzma
+import os
+import threading
+import zlib
+
+CODECS = {"raw": 0, "zlib": 1, "lzma": 2}   # ids stored in the container index
+DEFAULT_LEVELS = {"zlib": 6, "lzma": 1}
+
+COMPRESSION = os.environ.get("COMPRESSION", "off")
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "4096"))   # smaller chunks stay raw
+COMPRESS_MAX_RATIO = float(os.environ.get("COMPRESS_MAX_RATIO", "0.9"))
+COMPRESS_SAMPLES = int(os.environ.get("COMPRESS_SAMPLES", "4"))
+COMPRESS_SAMPLE_SIZE = int(os.environ.get("COMPRESS_SAMPLE_SIZE", str(16 * 1024)))
+
+
+def parse_codec(text):
+    """"zlib:9" → ("zlib", 9); "off" → ("raw", None)."""
+    name, _, level = text.strip().lower().partition(":")
+    if name in ("", "off", "none", "raw"):
+        return "raw", None
+    if name not in DEFAULT_LEVELS:
+        raise ValueError(f"unknown compression codec {name!r} (zlib or lzma)")
+    return name, int(level) if level else DEFAULT_LEVELS[name]
+
+
+def compress(codec, level, data):
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    if codec == "lzma":
+        return lzma.compress(data, preset=level)
+    return bytes(data)
+
+
+def decompress(codec, data):
+    """Plaintext of a chunk compressed with `codec` (a name or a container id)."""
+    if codec in ("zlib", CODECS["zlib"]):
+        return zlib.decompress(data)
+    if codec in ("lzma", CODECS["lzma"]):
+        return lzma.decompress(data)
+    if codec in ("raw", CODECS["raw"], None):
+        return data
+    raise ValueError(f"unknown compression codec {codec!r}")
+
+
+def sample(data):
+    """Up to COMPRESS_SAMPLES slices spread over `data`."""
+    if len(data) <= COMPRESS_SAMPLES * COMPRESS_SAMPLE_SIZE:
+        return data
+    step = (len(data) - COMPRESS_SAMPLE_SIZE) // max(COMPRESS_SAMPLES - 1, 1)
+    view = memoryview(data)
+    return b"".join(view[i * step:i * step + COMPRESS_SAMPLE_SIZE] for i in range(COMPRESS_SAMPLES))
+
+
+class Compressor:
+    """compress_chunk(chunk) → (codec, payload) with per-balancer counts for /compression_stats."""
+
+    def __init__(self, setting=COMPRESSION):
+        self.codec, self.level = parse_codec(setting)
+        self.lock = threading.Lock()
+        self.chunks = {name: 0 for name in CODECS}
+        self.skipped = 0          # chunks left raw by the sample test
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress_chunk(self, chunk):
+        codec, payload = "raw", chunk
+        if self.codec != "raw" and len(chunk) >= COMPRESS_MIN_SIZE:
+            probe = sample(chunk)
+            if len(zlib.compress(probe, 1)) > COMPRESS_MAX_RATIO * len(probe):
+                with self.lock:
+                    self.skipped += 1
+            else:
+                packed = compress(self.codec, self.level, chunk)
+                if len(packed) < len(chunk):
+                    codec, payload = self.codec, packed
+        with self.lock:
+            self.chunks[codec] += 1
+            self.bytes_in += len(chunk)
+            self.bytes_out += len(payload)
+        return codec, payload
+
+    def stats(self):
+        with self.lock:
+            return {
+                "codec": self.codec,
+                "level": self.level,
+                "chunks": dict(self.chunks),
+                "skipped_incompressible": self.skipped,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": self.bytes_out / self.bytes_in if self.bytes_in else None,
+            }
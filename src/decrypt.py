@@ -0,0 +1,123 @@
+# decrypt.py → Parallel streaming decryption of encrypted uploads
+#
+#   python decrypt.py encrypted/report.pdf.enc [-o report.pdf] [--workers 8]
+#   python decrypt.py old.enc --meta old.meta.json      (legacy .enc + .meta.json pair)
+#
+# Chunks are decrypted (and decompressed, see compression.py) in a process pool (each
+# worker reads its own ciphertext from the file, so only offsets and keys cross process
+# boundaries). Plaintext is yielded strictly
+# in chunk order with at most `window` chunks outstanding, and every GCM tag is verified.
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from compression import CODECS, decompress
+from fog_container import ContainerError, ContainerReader, TAG_LENGTH, load_kek
+
+CHUNK_SIZE = 5 * 1024 * 1024   # plaintext chunk size used by the balancers (legacy pairs)
+DECRYPT_WORKERS = int(os.environ.get("DECRYPT_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _decrypt_chunk(path, chunk, data_offset, data_length, nonce, key, codec):
+    with open(path, "rb") as f:
+        f.seek(data_offset)
+        data = f.read(data_length)
+    if len(data) != data_length:
+        raise ContainerError(f"chunk {chunk}: truncated ciphertext")
+    try:
+        plain = AESGCM(key).decrypt(nonce, data, None)
+    except InvalidTag:
+        raise ContainerError(f"chunk {chunk}: authentication tag mismatch") from None
+    return decompress(codec, plain)
+
+
+def container_tasks(path, kek=None):
+    """(chunk, data_offset, data_length, nonce, key, codec) for each chunk of a container,
+    in order."""
+    with ContainerReader(path, kek=kek) as reader:
+        if not reader.complete:
+            raise ContainerError("container is missing chunks")
+        return [(e["chunk"], e["data_offset"], e["data_length"], e["nonce"], reader.chunk_key(e),
+                 e["codec"]) for e in reader.entries]
+
+
+def legacy_tasks(path, meta_path, chunk_size=CHUNK_SIZE):
+    """Same as container_tasks for a raw .enc + .meta.json pair (fixed plaintext chunk size)."""
+    with open(meta_path) as f:
+        chunks = sorted(json.load(f)["chunks"], key=lambda c: c["chunk"])
+    total = os.path.getsize(path)
+    tasks, offset = [], 0
+    for i, c in enumerate(chunks):
+        if c["chunk"] != i or not c.get("key"):
+            raise ContainerError(f"chunk {i} missing from {meta_path}")
+        length = chunk_size + TAG_LENGTH if i < len(chunks) - 1 else total - offset
+        tasks.append((i, offset, length, bytes.fromhex(c["nonce"]), bytes.fromhex(c["key"]),
+                      CODECS[c.get("codec", "raw")]))
+        offset += length
+    if offset != total:
+        raise ContainerError("ciphertext size does not match the chunk list")
+    return tasks
+
+
+def iter_plaintext(path, tasks, workers=DECRYPT_WORKERS, window=None):
+    """Yield plaintext chunks in order while up to `window` chunks decrypt in parallel."""
+    window = window or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for task in tasks:
+            pending.append(pool.submit(_decrypt_chunk, path, *task))
+            if len(pending) >= window:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+
+def decrypt_file(path, out_path, meta_path=None, kek=None, workers=DECRYPT_WORKERS,
+                 chunk_size=CHUNK_SIZE):
+    start = time.time()
+    tasks = (legacy_tasks(path, meta_path, chunk_size) if meta_path
+             else container_tasks(path, kek))
+    written = 0
+    tmp_path = out_path + ".part"
+    try:
+        with open(tmp_path, "wb") as out:
+            for plain in iter_plaintext(path, tasks, workers):
+                out.write(plain)
+                written += len(plain)
+        os.replace(tmp_path, out_path)  # never leave a half-verified file under the real name
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    elapsed = time.time() - start
+    return {
+        "chunks": len(tasks),
+        "bytes": written,
+        "seconds": elapsed,
+        "mb_per_s": written / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "workers": workers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decrypt a fog-encrypted .enc file")
+    parser.add_argument("enc", help="container (.enc) or legacy ciphertext file")
+    parser.add_argument("-o", "--output", help="plaintext path (default: input without .enc)")
+    parser.add_argument("--meta", help="legacy .meta.json (raw .enc without container header)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="plaintext chunk size of a legacy pair")
+    parser.add_argument("--workers", type=int, default=DECRYPT_WORKERS)
+    args = parser.parse_args()
+
+    output = args.output or (args.enc[:-4] if args.enc.endswith(".enc") else args.enc + ".dec")
+    stats = decrypt_file(args.enc, output, args.meta, load_kek(), args.workers, args.chunk_size)
+    print(f"{output}: {stats['bytes']} bytes, {stats['chunks']} chunks, "
+          f"{stats['mb_per_s']:.1f} MB/s with {stats['workers']} workers")
+
+
+if __name__ == "__main__":
+    main()
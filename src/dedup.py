@@ -0,0 +1,155 @@
+# dedup.py → Convergent encryption and a dedup cache for repeated chunks (opt-in: DEDUP=1)
+#
+# In convergent mode the fog nodes derive each chunk's key and nonce from the chunk and a
+# salt (chunk_transport.convergent_key), so the same chunk always encrypts to the same
+# ciphertext. The balancer hashes every chunk before dispatch and keeps the results it got
+# back in an LRU index bounded by DEDUP_CACHE_BYTES of ciphertext. A chunk seen before is
+# answered from the index without being sent to any node. A chunk that is already being
+# encrypted for another upload waits for that result (at most DEDUP_WAIT s) instead of
+# being sent twice.
+#
+# Chunk boundaries must not move between uploads for repeated content to line up, so while
+# dedup is on files are cut into fixed DEDUP_CHUNK_SIZE chunks instead of adaptive ones.
+#
+# DEDUP_SCOPE=tenant (default): each tenant (X-Tenant header of the upload, see jobs.py)
+# gets its own salt and cache entries, so neither a cache hit nor an identical ciphertext
+# tells one tenant what another stored. DEDUP_SCOPE=global shares both. Salts are an HMAC
+# of the tenant under DEDUP_SECRET, which DEDUP=1 requires: with a public secret anyone
+# could compute a tenant's salt. Balancers (and restarts) sharing the secret produce the
+# same ciphertexts.
+#
+# X-Tenant is NOT authenticated: the balancers trust whatever the caller sends, and a hit
+# shows in the result ("dedup": true, and in its timing). Per-tenant isolation therefore
+# only holds if the header is set by a trusted front end (e.g. a proxy that authenticates
+# clients and overwrites X-Tenant); with direct access to a balancer, a caller can name
+# another tenant and learn whether it stored a given chunk.
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+import lb_metrics
+
+DEDUP = os.environ.get("DEDUP", "0") == "1"
+DEDUP_SCOPE = os.environ.get("DEDUP_SCOPE", "tenant")
+DEDUP_CACHE_BYTES = int(os.environ.get("DEDUP_CACHE_BYTES", str(256 * 1024 * 1024)))
+DEDUP_SECRET = os.environ.get("DEDUP_SECRET", "").encode()
+DEDUP_WAIT = float(os.environ.get("DEDUP_WAIT", "60"))  # s a duplicate waits for the original
+DEDUP_CHUNK_SIZE = int(os.environ.get("DEDUP_CHUNK_SIZE", str(1024 * 1024)))
+
+CACHED_FIELDS = ("node_used", "result", "key", "nonce", "codec")
+
+
+class DedupCache:
+    """lookup() before dispatching a chunk, store() once its result is known."""
+
+    def __init__(self, enabled=DEDUP, max_bytes=DEDUP_CACHE_BYTES, scope=DEDUP_SCOPE,
+                 secret=DEDUP_SECRET):
+        if enabled and not secret:
+            raise ValueError("DEDUP=1 requires DEDUP_SECRET (tenant salts derive from it)")
+        if scope not in ("tenant", "global"):
+            raise ValueError(f"DEDUP_SCOPE must be tenant or global, not {scope!r}")
+        self.enabled = enabled
+        self.secret = secret
+        self.max_bytes = max_bytes
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # (salt, sha256) -> cached result, least recent first
+        self.pending = {}              # (salt, sha256) -> Future of a chunk being encrypted
+        self.bytes = 0
+        self.hits = 0
+        self.waits = 0                 # hits that waited for an in-flight original
+        self.misses = 0
+        self.saved_bytes = 0
+        self.evictions = 0
+
+    def salt(self, tenant):
+        """Convergent salt (hex) for uploads of `tenant`; None when dedup is off."""
+        if not self.enabled:
+            return None
+        scope = tenant if self.scope == "tenant" else ""
+        return hmac.new(self.secret, scope.encode(), hashlib.sha256).hexdigest()
+
+    def chunk_sizes(self, total):
+        """Fixed chunk sizes for a `total`-byte upload (None: unknown), or None when dedup
+        is off and the balancer picks its own."""
+        if not self.enabled:
+            return None
+        return [DEDUP_CHUNK_SIZE] * max(1, -(-(total or 0) // DEDUP_CHUNK_SIZE))
+
+    def lookup(self, salt, chunk):
+        """(cache key, cached result or None). On a miss the caller encrypts the chunk and
+        must call store(cache key, entry). Both are None when `salt` is None (dedup off)."""
+        if salt is None:
+            return None, None
+        key = (salt, hashlib.sha256(chunk).digest())
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                self.entries.move_to_end(key)
+            else:
+                pending = self.pending.get(key)
+                if pending is None:
+                    self.pending[key] = Future()
+                    self._miss()
+                    return key, None
+        if cached is None:
+            try:
+                cached = pending.result(timeout=DEDUP_WAIT)
+            except TimeoutError:
+                cached = None
+            if cached is None:  # the original failed or is stuck: encrypt this one too
+                with self.lock:
+                    self._miss()
+                return key, None
+            with self.lock:
+                self.waits += 1
+        with self.lock:
+            self.hits += 1
+            self.saved_bytes += len(chunk)
+        lb_metrics.dedup_lookups.labels(result="hit").inc()
+        lb_metrics.dedup_saved_bytes.inc(len(chunk))
+        return key, cached
+
+    def _miss(self):
+        # caller holds the lock
+        self.misses += 1
+        lb_metrics.dedup_lookups.labels(result="miss").inc()
+
+    def store(self, key, entry):
+        """Publish the result entry of a missed chunk (failed entries are not cached)."""
+        if key is None:
+            return
+        cached = None
+        if entry is not None and not entry.get("error") and entry.get("result") is not None:
+            cached = {f: entry.get(f) for f in CACHED_FIELDS}
+        with self.lock:
+            pending = self.pending.pop(key, None)
+            if cached is not None and key not in self.entries:
+                self.entries[key] = cached
+                self.bytes += len(cached["result"])
+                while self.bytes > self.max_bytes and self.entries:
+                    _, old = self.entries.popitem(last=False)
+                    self.bytes -= len(old["result"])
+                    self.evictions += 1
+        if pending is not None:
+            pending.set_result(cached)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "scope": self.scope,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "waits": self.waits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "saved_bytes": self.saved_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,140 @@
+# dispatcher.py → Bounded, fair chunk dispatcher shared by the load balancers
+#
+# Chunking (request thread) → per-job bounded queue → fixed pool of workers → fog nodes.
+# submit() blocks once the job's queue is full, so a huge upload can never create more
+# than MAX_IN_FLIGHT threads nor hold more than DISPATCH_QUEUE_SIZE waiting chunks per job.
+# Workers serve jobs round-robin (one chunk per job per turn), so concurrent uploads
+# interleave across the fog nodes instead of queueing behind each other.
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import lb_metrics
+
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "6"))
+MAX_IN_FLIGHT_PER_NODE = int(os.environ.get("MAX_IN_FLIGHT_PER_NODE", "2"))
+DISPATCH_QUEUE_SIZE = int(os.environ.get("DISPATCH_QUEUE_SIZE", "8"))  # per job
+
+
+class ChunkDispatcher:
+    def __init__(self, nodes, workers=MAX_IN_FLIGHT, per_node=MAX_IN_FLIGHT_PER_NODE,
+                 queue_size=DISPATCH_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.cond = threading.Condition()
+        self.pending = {}      # job id -> deque of queued chunks
+        self.ready = deque()   # job ids with queued chunks, in service order
+        self.per_node = per_node
+        self.nodes = list(nodes)
+        self.node_slots = {n: threading.BoundedSemaphore(per_node) for n in nodes}
+        self.stats_lock = threading.Lock()
+        self.in_flight = {n: 0 for n in nodes}
+        self.dispatched = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"dispatch-{i}", daemon=True).start()
+
+    def submit(self, job, fn, *args):
+        """Queue fn(*args) for a worker on behalf of `job`; blocks while the job's queue is full."""
+        fut = Future()
+        with self.cond:
+            while len(self.pending.get(job.id, ())) >= self.queue_size:
+                self.cond.wait()
+            q = self.pending.setdefault(job.id, deque())
+            if not q:
+                self.ready.append(job.id)
+            q.append((time.time(), fut, fn, args))
+            self.cond.notify_all()
+        return fut
+
+    def _next(self):
+        with self.cond:
+            while not self.ready:
+                self.cond.wait()
+            job_id = self.ready.popleft()
+            q = self.pending[job_id]
+            item = q.popleft()
+            if q:
+                self.ready.append(job_id)  # back of the line: next turn goes to another job
+            else:
+                del self.pending[job_id]
+            self.cond.notify_all()  # room freed for a blocked submit()
+            return item
+
+    def _worker(self):
+        while True:
+            enqueued, fut, fn, args = self._next()
+            started = time.time()
+            waited = started - enqueued
+            with self.stats_lock:
+                self.dispatched += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            lb_metrics.chunk_queue_seconds.observe(waited)
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+            lb_metrics.chunk_seconds.observe(time.time() - started)
+
+    def add_node(self, node):
+        with self.stats_lock:
+            if node not in self.nodes:
+                self.nodes.append(node)
+            # a node that comes back keeps its slots: chunks may still be in flight on it
+            self.node_slots.setdefault(node, threading.BoundedSemaphore(self.per_node))
+            self.in_flight.setdefault(node, 0)
+
+    def remove_node(self, node):
+        with self.stats_lock:
+            if node in self.nodes:
+                self.nodes.remove(node)
+
+    def least_loaded(self, exclude=()):
+        """Node with the fewest in-flight chunks that still has a free slot (None if all busy)."""
+        with self.stats_lock:
+            free = [(n, self.in_flight[n]) for n in self.nodes
+                    if n not in exclude and self.in_flight[n] < self.per_node]
+        return min(free, key=lambda nc: nc[1])[0] if free else None
+
+    def node_slot(self, node):
+        """Context manager holding one of the node's MAX_IN_FLIGHT_PER_NODE slots."""
+        return _NodeSlot(self, node)
+
+    def stats(self):
+        with self.cond:
+            depth = sum(len(q) for q in self.pending.values())
+            active_jobs = len(self.pending)
+        with self.stats_lock:
+            return {
+                "queue_depth": depth,
+                "queue_capacity_per_job": self.queue_size,
+                "queued_jobs": active_jobs,
+                "dispatched": self.dispatched,
+                "wait_avg": self.wait_total / self.dispatched if self.dispatched else 0.0,
+                "wait_max": self.wait_max,
+                "in_flight": {n: self.in_flight[n] for n in self.nodes},
+                "per_node_limit": self.per_node,
+            }
+
+
+class _NodeSlot:
+    def __init__(self, dispatcher, node):
+        self.d = dispatcher
+        self.node = node
+
+    def __enter__(self):
+        self.d.node_slots[self.node].acquire()
+        with self.d.stats_lock:
+            self.d.in_flight[self.node] += 1
+        return self.node
+
+    def __exit__(self, *exc):
+        with self.d.stats_lock:
+            self.d.in_flight[self.node] -= 1
+        self.d.node_slots[self.node].release()
+        return False
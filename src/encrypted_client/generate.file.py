@@ -1,11 +1,22 @@
+import sys
+
 sentence = "This is our cute big txt file that we will encrypt.\n"
-size_mo = 2
-size_bytes = size_mo * 1024 * 1024
 
-repeats = size_bytes // len(sentence.encode("utf-8"))
 
-with open(f"{size_mo}Mo_file.txt", "w", encoding="utf-8") as f:
-    for _ in range(repeats):
-        f.write(sentence)
+def make_text(size_bytes):
+    # The sentence repeated up to size_bytes (also used by benchmark.py for "text" payloads)
+    data = sentence.encode("utf-8")
+    return data * (size_bytes // len(data)) + data[:size_bytes % len(data)]
+
+
+if __name__ == "__main__":
+    size_mo = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    size_bytes = size_mo * 1024 * 1024
+
+    repeats = size_bytes // len(sentence.encode("utf-8"))
+
+    with open(f"{size_mo}Mo_file.txt", "w", encoding="utf-8") as f:
+        for _ in range(repeats):
+            f.write(sentence)
 
-print("File generated successfully")
\ No newline at end of file
+    print("File generated successfully")
@@ -0,0 +1,204 @@
+# fog_container.py → Indexed single-file container for encrypted uploads (.enc)
+#
+# Layout (all integers big-endian):
+#   header  (32 bytes)  magic "FOGENC", version, flags, chunk_size, chunk_count,
+#                       plaintext_size, index_offset
+#   data                ciphertexts (GCM tag included), in the order they were received
+#   index   (at index_offset) one fixed-size entry per chunk, sorted by chunk number:
+#                       chunk, plain_offset, plain_length, data_offset, data_length,
+#                       nonce, key (raw or AES-key-wrapped), tag_length, codec
+#
+# codec (version 2) is the compression applied before encryption (compression.CODECS);
+# plain_length is then the decompressed size. Version 1 files (no codec) are still read.
+#
+# The writer appends ciphertexts as they arrive (any order) and writes the index and the
+# final header on close(). The reader mmaps the file and decrypts only the chunks that
+# cover the requested byte range.
+import bisect
+import mmap
+import os
+import struct
+import threading
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.keywrap import aes_key_unwrap, aes_key_wrap
+
+from compression import CODECS, decompress
+
+MAGIC = b"FOGENC"
+VERSION = 2
+
+FLAG_WRAPPED_KEYS = 0x01   # keys are AES-key-wrapped with a key-encryption key (KEK)
+FLAG_INCOMPLETE = 0x02     # some chunk numbers are missing (failed chunks)
+
+HEADER = struct.Struct("!6sBBIIQQ")
+ENTRY_V1 = struct.Struct("!IQIQI12sB40sB")
+ENTRY = struct.Struct("!IQIQI12sB40sBB")
+TAG_LENGTH = 16
+
+
+class ContainerError(Exception):
+    pass
+
+
+class ContainerWriter:
+    """Stream chunks into a container; add_chunk() may be called in any chunk order."""
+
+    def __init__(self, path, chunk_size=0, kek=None):
+        self.path = path
+        self.chunk_size = chunk_size   # nominal plaintext chunk size (0 = variable, None = derive)
+        self.kek = kek
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.file = open(path, "wb")
+        self.file.write(b"\0" * HEADER.size)  # real header written by close()
+
+    def add_chunk(self, chunk, nonce, key, ciphertext, tag_length=TAG_LENGTH, plain_offset=None,
+                  plain_length=None, codec="raw"):
+        """plain_offset: where the chunk starts in the plaintext (default: right after the
+        previous chunk number, which is only right if no chunk is missing).
+        plain_length: plaintext size, required when `codec` compressed the chunk."""
+        if codec not in CODECS:
+            raise ContainerError(f"chunk {chunk}: unknown codec {codec!r}")
+        if codec != "raw" and plain_length is None:
+            raise ContainerError(f"chunk {chunk}: compressed chunks need their plaintext length")
+        if len(nonce) != 12:
+            raise ContainerError(f"chunk {chunk}: expected a 12-byte nonce")
+        if self.kek is not None:
+            key = aes_key_wrap(self.kek, key)
+        if len(key) > 40:
+            raise ContainerError(f"chunk {chunk}: key too long")
+        with self.lock:
+            if chunk in self.entries:
+                raise ContainerError(f"chunk {chunk} written twice")
+            offset = self.file.tell()
+            self.file.write(ciphertext)
+            self.entries[chunk] = (offset, len(ciphertext), nonce, key, tag_length, plain_offset,
+                                   plain_length, CODECS[codec])
+
+    def close(self):
+        with self.lock:
+            flags = FLAG_WRAPPED_KEYS if self.kek is not None else 0
+            chunks = sorted(self.entries)
+            if chunks != list(range(len(chunks))):
+                flags |= FLAG_INCOMPLETE
+
+            index_offset = self.file.tell()
+            plain_offset = 0
+            lengths = []
+            for chunk in chunks:
+                (data_offset, data_length, nonce, key, tag_length, offset, plain_length,
+                 codec) = self.entries[chunk]
+                if plain_length is None:
+                    plain_length = data_length - tag_length
+                if offset is not None:
+                    plain_offset = offset
+                lengths.append(plain_length)
+                self.file.write(ENTRY.pack(chunk, plain_offset, plain_length, data_offset,
+                                           data_length, nonce, len(key), key, tag_length, codec))
+                plain_offset += plain_length
+
+            # Nominal size: what every chunk but the last has, 0 if they differ
+            chunk_size = self.chunk_size
+            if chunk_size is None:
+                chunk_size = lengths[0] if len(set(lengths[:-1])) <= 1 and lengths else 0
+
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, flags, chunk_size, len(chunks),
+                                        plain_offset, index_offset))
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class ContainerReader:
+    """Random-access decryption of a container through mmap."""
+
+    def __init__(self, path, kek=None):
+        self.kek = kek
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            raise ContainerError("file too short for a container header")
+        (magic, version, self.flags, self.chunk_size, count,
+         self.size, index_offset) = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ContainerError("not a fog container (bad magic)")
+        if version not in (1, VERSION):
+            raise ContainerError(f"unsupported container version {version}")
+        if self.flags & FLAG_WRAPPED_KEYS and kek is None:
+            raise ContainerError("container keys are wrapped: a KEK is required")
+
+        entry = ENTRY if version == VERSION else ENTRY_V1
+        self.entries = []
+        for i in range(count):
+            (chunk, plain_offset, plain_length, data_offset, data_length, nonce,
+             key_length, key, tag_length, *codec) = entry.unpack_from(self.mm, index_offset + i * entry.size)
+            self.entries.append({
+                "chunk": chunk, "plain_offset": plain_offset, "plain_length": plain_length,
+                "data_offset": data_offset, "data_length": data_length,
+                "nonce": nonce, "key": key[:key_length], "tag_length": tag_length,
+                "codec": codec[0] if codec else CODECS["raw"],
+            })
+        self._starts = [e["plain_offset"] for e in self.entries]
+
+    @property
+    def complete(self):
+        return not self.flags & FLAG_INCOMPLETE
+
+    def chunk_key(self, entry):
+        if self.flags & FLAG_WRAPPED_KEYS:
+            return aes_key_unwrap(self.kek, entry["key"])
+        return entry["key"]
+
+    def decrypt_entry(self, entry):
+        """Decrypt (and decompress) one chunk; raises cryptography's InvalidTag if it was
+        tampered with."""
+        start = entry["data_offset"]
+        data = memoryview(self.mm)[start:start + entry["data_length"]]
+        try:
+            plain = AESGCM(self.chunk_key(entry)).decrypt(entry["nonce"], data, None)
+        finally:
+            data.release()
+        return decompress(entry["codec"], plain)
+
+    def read(self, offset=0, length=None):
+        """Plaintext bytes [offset, offset + length), decrypting only the chunks involved."""
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError(f"invalid byte range: offset {offset}, length {length}")
+        if not self.complete:
+            raise ContainerError("container is missing chunks: byte offsets are unreliable")
+        end = self.size if length is None else min(offset + length, self.size)
+        if offset >= end:
+            return b""
+        out = bytearray()
+        i = bisect.bisect_right(self._starts, offset) - 1
+        while i < len(self.entries) and self.entries[i]["plain_offset"] < end:
+            entry = self.entries[i]
+            plain = self.decrypt_entry(entry)
+            lo = max(offset - entry["plain_offset"], 0)
+            hi = min(end - entry["plain_offset"], entry["plain_length"])
+            out += plain[lo:hi]
+            i += 1
+        return bytes(out)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def load_kek():
+    """Key-encryption key from CONTAINER_KEK (hex), or None to store chunk keys unwrapped."""
+    kek = os.environ.get("CONTAINER_KEK")
+    return bytes.fromhex(kek) if kek else None
@@ -1,95 +1,286 @@
 # fog_node.py
 
 from flask import Flask, request, jsonify, Response
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import Gauge, Histogram
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import os, threading, time, psutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from prometheus_client import Counter
+from chunk_transport import (BATCH_MIME, CHUNK_MIME, batch_response_body, busy_headers,
+                             convergent_key, convergent_salt, decode_batch, wants, task_headers)
+from membership import advertise_url, start_heartbeats
+from metrics import LATENCY_BUCKETS, SIZE_BUCKETS, metrics_routes
+from telemetry import TelemetrySender
+from tracing import TRACE_HEADER, server_timing
 
 app = Flask(__name__)
+app.register_blueprint(metrics_routes())  # Prometheus, on the node's own port
 
 cpu_gauge = Gauge('fog_cpu_percent', 'CPU usage percent')
 tasks_gauge = Gauge('fog_tasks_running', 'Number of tasks running')
 ram_gauge = Gauge('fog_ram_percent', 'RAM usage percent')
-chunks_counter = Counter('chunks_processed_total', 'Total chunks processed', ['node', 'file'])
+ram_used_gauge = Gauge('fog_ram_used_mb', 'RAM used in MB')
+queue_gauge = Gauge('fog_queue_depth', 'Admitted tasks waiting for a slot')
+chunks_counter = Counter('chunks_processed_total', 'Total chunks processed', ['node'])
+rejected_counter = Counter('fog_tasks_rejected_total', 'Tasks rejected by admission control')
+encrypt_histogram = Histogram('fog_encrypt_seconds', 'AES-GCM time per chunk', buckets=LATENCY_BUCKETS)
+request_histogram = Histogram('fog_request_seconds', 'Admitted /task and /task_batch requests, '
+                              'queue wait included', ['endpoint'], buckets=LATENCY_BUCKETS)
+bytes_histogram = Histogram('fog_chunk_bytes', 'Plaintext bytes per chunk', buckets=SIZE_BUCKETS)
+queue_wait_histogram = Histogram('fog_queue_wait_seconds', 'Time admitted tasks wait for a slot',
+                                 buckets=LATENCY_BUCKETS)
 
 tasks_running = 0
+tasks_waiting = 0    # admitted, waiting for a task slot
+encrypt_mbps = 0.0   # EWMA of the encryption speed of recent tasks
+task_seconds = 0.05  # EWMA of how long a task holds its slot
 lock = threading.Lock()
 
 PORT = int(os.environ.get("PORT", "5001"))
-METRICS_PORT = 8000 + (PORT % 1000)
+SAMPLE_INTERVAL = float(os.environ.get("SAMPLE_INTERVAL", "0.25"))
+CPU_COUNT = psutil.cpu_count() or 1
+
+# Admission control: at most MAX_CONCURRENT_TASKS encrypt at once, MAX_QUEUED_TASKS more may
+# wait (up to QUEUE_TIMEOUT s) for a slot; anything beyond is rejected at once with a 503
+MAX_CONCURRENT_TASKS = int(os.environ.get("MAX_CONCURRENT_TASKS", str(CPU_COUNT)))
+MAX_QUEUED_TASKS = int(os.environ.get("MAX_QUEUED_TASKS", str(2 * CPU_COUNT)))
+QUEUE_TIMEOUT = float(os.environ.get("QUEUE_TIMEOUT", "10"))
+task_slots = threading.BoundedSemaphore(MAX_CONCURRENT_TASKS)
+# A /task_batch holds one task slot and encrypts its chunks in parallel on this pool
+# (AESGCM releases the GIL)
+batch_pool = ThreadPoolExecutor(max_workers=CPU_COUNT, thread_name_prefix="batch")
+
+SLOW_TASK = float(os.environ.get("SLOW_TASK", "1"))  # s: slower tasks are logged with their trace
+
+BENCH_SECONDS = float(os.environ.get("BENCH_SECONDS", "0.3"))
+BENCH_BLOCK = 1024 * 1024
+
+def benchmark():
+    """AES-GCM throughput of this machine, measured once at startup.
+
+    bench_mbps is one stream (what a single chunk gets); capacity_mbps runs as many streams
+    as the node encrypts at once, and is what the balancers use as its weight.
+    """
+    block = os.urandom(BENCH_BLOCK)
+    nonce = os.urandom(12)
+
+    def stream(totals):
+        aes = AESGCM(AESGCM.generate_key(bit_length=128))
+        end = time.time() + BENCH_SECONDS
+        done = 0
+        while time.time() < end:
+            aes.encrypt(nonce, block, None)
+            done += len(block)
+        totals.append(done)
+
+    single = []
+    stream(single)
+    parallel = min(CPU_COUNT, MAX_CONCURRENT_TASKS)
+    totals = []
+    workers = [threading.Thread(target=stream, args=(totals,)) for _ in range(parallel)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    mb = 1024 * 1024 * BENCH_SECONDS
+    return {
+        "cores": CPU_COUNT,
+        "bench_mbps": round(single[0] / mb, 1),
+        "capacity_mbps": round(sum(totals) / mb, 1),
+    }
+
+BENCHMARK = benchmark()
+print(f"[Fog {PORT}] AES-GCM benchmark: {BENCHMARK}")
+
+def sample_load():
+    # cpu_percent(interval=None) is non-blocking: usage since the previous call
+    vm = psutil.virtual_memory()
+    return {
+        "cpu_percent": psutil.cpu_percent(interval=None),
+        "ram_percent": vm.percent,
+        "ram_used_mb": vm.used / (1024 * 1024),
+        "tasks_running": tasks_running,
+        "queue_depth": tasks_waiting,
+        "encrypt_mbps": encrypt_mbps,
+        "ts": time.time(),
+    }
+
+# Latest load sample; the sampler thread replaces the whole dict, handlers only read it
+load_snapshot = sample_load()
 
 def update_metrics():
-    global tasks_running
+    global load_snapshot
     while True:
-        cpu_gauge.set(psutil.cpu_percent(interval=0.1))
-        ram_gauge.set(psutil.virtual_memory().percent)
-        tasks_gauge.set(tasks_running)
-        time.sleep(1)
+        time.sleep(SAMPLE_INTERVAL)
+        load_snapshot = snap = sample_load()
+        cpu_gauge.set(snap["cpu_percent"])
+        ram_gauge.set(snap["ram_percent"])
+        ram_used_gauge.set(snap["ram_used_mb"])
+        tasks_gauge.set(snap["tasks_running"])
+        queue_gauge.set(snap["queue_depth"])
+
+def load_report():
+    # Payload of /health and of the heartbeats sent to the load balancers
+    snap = load_snapshot
+    return {
+        "cpu_percent": snap["cpu_percent"],
+        "ram_percent": snap["ram_percent"],
+        "tasks_running": snap["tasks_running"],
+        "queue_depth": snap["queue_depth"],
+        "encrypt_mbps": snap["encrypt_mbps"],
+        "sample_age": time.time() - snap["ts"]
+    }
 
 threading.Thread(target=update_metrics, daemon=True).start()
-start_http_server(METRICS_PORT)
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({
-        "status": "ok",
-        "port": PORT,
-        "cpu_percent": psutil.cpu_percent(interval=0.05),
-        "ram_percent": psutil.virtual_memory().percent,
-        "tasks_running": tasks_running
-    })
-@app.route('/metrics')
-def metrics():
-    cpu = psutil.cpu_percent()
-    memory = psutil.virtual_memory().used / (1024 * 1024)
-
-    data = f"""
-# HELP cpu_usage CPU usage percentage
-# TYPE cpu_usage gauge
-cpu_usage {cpu}
-
-# HELP memory_usage Memory usage in MB
-# TYPE memory_usage gauge
-memory_usage {memory}
-"""
-
-    return Response(data, mimetype="text/plain")
+    return jsonify(dict(load_report(), **BENCHMARK, status="ok", port=PORT))
+def overloaded():
+    # Sent before the body is read, so a shed request costs neither time nor memory
+    with lock:
+        queued = tasks_waiting
+    retry_after = max(0.05, task_seconds * (queued + 1) / MAX_CONCURRENT_TASKS)
+    rejected_counter.inc()
+    return (jsonify({"error": "overloaded", "queue_depth": queued, "retry_after": retry_after}),
+            503, busy_headers(retry_after, queued))
 
-@app.route("/task", methods=["POST"])
-def task():
-    global tasks_running
-    chunk = request.data
+def acquire_slot():
+    """Admission control for /task and /task_batch: None once a task slot is held,
+    otherwise the 503 response to send."""
+    global tasks_running, tasks_waiting
+
+    with lock:
+        admitted = tasks_running + tasks_waiting < MAX_CONCURRENT_TASKS + MAX_QUEUED_TASKS
+        if admitted:
+            tasks_waiting += 1
+    if not admitted:
+        return overloaded()
 
+    wait_start = time.time()
+    got_slot = task_slots.acquire(timeout=QUEUE_TIMEOUT)
+    queue_wait_histogram.observe(time.time() - wait_start)
     with lock:
-        tasks_running += 1
+        tasks_waiting -= 1
+        if got_slot:
+            tasks_running += 1
+    if not got_slot:
+        return overloaded()
+    return None
 
+def release_slot(slot_start):
+    global tasks_running, task_seconds
+    with lock:
+        tasks_running -= 1
+        task_seconds = 0.3 * (time.time() - slot_start) + 0.7 * task_seconds
+    task_slots.release()
+
+def encrypt_chunk(chunk, salt=None):
+    """Encrypt one chunk under a fresh key, or the convergent key of `salt` (see
+    chunk_transport.convergent_key): (ciphertext, nonce, key, processing_time)."""
+    global encrypt_mbps
     start_time = time.time()
 
-    try:
+    if salt is not None:
+        key, nonce = convergent_key(salt, chunk)
+    else:
         key = AESGCM.generate_key(bit_length=128)
-        aes = AESGCM(key)
-
         nonce = os.urandom(12)
-        ciphertext = aes.encrypt(nonce, chunk, None)
+    aes = AESGCM(key)
+    ciphertext = aes.encrypt(nonce, chunk, None)
+
+    processing_time = time.time() - start_time
+    encrypt_histogram.observe(processing_time)
+    bytes_histogram.observe(len(chunk))
+    if processing_time > 0:
+        mbps = len(chunk) / (1024 * 1024) / processing_time
+        with lock:
+            encrypt_mbps = mbps if not encrypt_mbps else 0.3 * mbps + 0.7 * encrypt_mbps
+    return ciphertext, nonce, key, processing_time
+
+def with_timing(resp, request_start, slot_start, read_time, aes_time, serialize_start):
+    # Stage breakdown for the balancer's chunk traces (see tracing.py)
+    now = time.time()
+    stages = {"node_queue": slot_start - request_start, "receive": read_time, "aes": aes_time,
+              "serialize": now - serialize_start}
+    resp.headers["Server-Timing"] = server_timing(**stages)
+    if now - request_start > SLOW_TASK:
+        print(f"[Fog {PORT}] slow task, {request.headers.get(TRACE_HEADER, 'no trace')}: "
+              f"{resp.headers['Server-Timing']}")
+    return resp
 
-        processing_time = time.time() - start_time
-        file_name = request.headers.get('X-File-Name', 'unknown')
-        chunks_counter.labels(node=str(PORT), file=file_name).inc()
+@app.route("/task", methods=["POST"])
+def task():
+    try:
+        salt = convergent_salt(request)
+    except ValueError:
+        return jsonify({"error": "invalid convergent salt"}), 400
+    request_start = time.time()
+    busy = acquire_slot()
+    if busy is not None:
+        return busy
 
+    slot_start = time.time()
+    try:
+        chunk = request.data
+        read_time = time.time() - slot_start
+        ciphertext, nonce, key, processing_time = encrypt_chunk(chunk, salt)
+        chunks_counter.labels(node=str(PORT)).inc()
 
-        return jsonify({
-            "result": ciphertext.hex(),
-            "nonce": nonce.hex(),
-            "key": key.hex(),
-            "processing_time": processing_time,
-            "node_used": PORT
-        })
+        serialize_start = time.time()
+        # Binary mode: raw ciphertext in the body, crypto material in headers
+        if wants(request, CHUNK_MIME):
+            resp = Response(ciphertext, mimetype=CHUNK_MIME,
+                            headers=task_headers(nonce, key, processing_time, PORT))
+        else:
+            resp = jsonify({
+                "result": ciphertext.hex(),
+                "nonce": nonce.hex(),
+                "key": key.hex(),
+                "processing_time": processing_time,
+                "node_used": PORT
+            })
+        return with_timing(resp, request_start, slot_start, read_time, processing_time,
+                           serialize_start)
 
     finally:
-        with lock:
-            tasks_running -= 1
+        release_slot(slot_start)
+        request_histogram.labels(endpoint="task").observe(time.time() - request_start)
+
+@app.route("/task_batch", methods=["POST"])
+def task_batch():
+    # Several chunks in one request (see chunk_transport.py for the format)
+    try:
+        salt = convergent_salt(request)
+    except ValueError:
+        return jsonify({"error": "invalid convergent salt"}), 400
+    request_start = time.time()
+    busy = acquire_slot()
+    if busy is not None:
+        return busy
+
+    slot_start = time.time()
+    try:
+        try:
+            chunks = decode_batch(request.get_data())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        aes_start = time.time()
+        results = list(batch_pool.map(partial(encrypt_chunk, salt=salt), chunks))
+        serialize_start = time.time()
+        chunks_counter.labels(node=str(PORT)).inc(len(chunks))
+        resp = Response(batch_response_body(results, PORT), mimetype=BATCH_MIME)
+        return with_timing(resp, request_start, slot_start, aes_start - slot_start,
+                           serialize_start - aes_start, serialize_start)
 
+    finally:
+        release_slot(slot_start)
+        request_histogram.labels(endpoint="task_batch").observe(time.time() - request_start)
 
 if __name__ == "__main__":
+    # Register with the load balancers (LOAD_BALANCERS) and keep heartbeating;
+    # balancers that subscribe also get the load pushed over UDP (see telemetry.py)
+    url = advertise_url(PORT)
+    start_heartbeats(url, load_report, BENCHMARK, telemetry=TelemetrySender(url, load_report))
     app.run(host="0.0.0.0", port=PORT)
\ No newline at end of file
@@ -0,0 +1,94 @@
+# fog_stub.py → Stand-in fog node with a configurable speed (used by benchmark.py)
+#
+# Speaks the fog node protocol (/task, /task_batch, /health, registration and heartbeats)
+# but each call takes STUB_LATENCY + size / STUB_MBPS seconds, at most STUB_SLOTS calls at
+# a time, whatever the machine. Ciphertexts are real AES-GCM so results still decrypt.
+from flask import Flask, Response, jsonify, request
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import os, threading, time
+from chunk_transport import (BATCH_MIME, CHUNK_MIME, batch_response_body, convergent_key,
+                             convergent_salt, decode_batch, task_headers)
+from membership import advertise_url, start_heartbeats
+from metrics import metrics_routes
+from telemetry import TelemetrySender
+from tracing import server_timing
+
+app = Flask(__name__)
+app.register_blueprint(metrics_routes())
+
+PORT = int(os.environ.get("PORT", "5101"))
+STUB_LATENCY = float(os.environ.get("STUB_LATENCY", "0.005"))  # s per call
+STUB_MBPS = float(os.environ.get("STUB_MBPS", "100"))          # MB/s per call
+STUB_SLOTS = int(os.environ.get("STUB_SLOTS", "4"))            # calls served at once
+
+slots = threading.Semaphore(STUB_SLOTS)
+tasks_running = 0
+tasks_waiting = 0
+lock = threading.Lock()
+
+def encrypt(chunk, salt=None):
+    if salt is not None:
+        key, nonce = convergent_key(salt, chunk)
+    else:
+        key = AESGCM.generate_key(bit_length=128)
+        nonce = os.urandom(12)
+    return AESGCM(key).encrypt(nonce, chunk, None), nonce, key
+
+def serve(size, work):
+    """Run work() in a slot, padded to the configured duration of a `size`-byte call."""
+    global tasks_running, tasks_waiting
+    with lock:
+        tasks_waiting += 1
+    with slots:
+        with lock:
+            tasks_waiting -= 1
+            tasks_running += 1
+        try:
+            start = time.time()
+            result = work()
+            time.sleep(max(0.0, STUB_LATENCY + size / (STUB_MBPS * 1024 * 1024) - (time.time() - start)))
+            return result, time.time() - start
+        finally:
+            with lock:
+                tasks_running -= 1
+
+def load_report():
+    return {"cpu_percent": 0.0, "ram_percent": 0.0, "tasks_running": tasks_running,
+            "queue_depth": tasks_waiting, "encrypt_mbps": STUB_MBPS, "sample_age": 0.0}
+
+@app.route("/health")
+def health():
+    return jsonify(dict(load_report(), status="ok", port=PORT, stub=True))
+
+@app.route("/task", methods=["POST"])
+def task():
+    chunk = request.get_data()
+    try:
+        salt = convergent_salt(request)
+    except ValueError:
+        return jsonify({"error": "invalid convergent salt"}), 400
+    (ciphertext, nonce, key), seconds = serve(len(chunk), lambda: encrypt(chunk, salt))
+    headers = dict(task_headers(nonce, key, seconds, PORT), **{"Server-Timing": server_timing(aes=seconds)})
+    return Response(ciphertext, mimetype=CHUNK_MIME, headers=headers)
+
+@app.route("/task_batch", methods=["POST"])
+def task_batch():
+    try:
+        salt = convergent_salt(request)
+    except ValueError:
+        return jsonify({"error": "invalid convergent salt"}), 400
+    body = request.get_data()
+    try:
+        chunks = decode_batch(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    results, seconds = serve(len(body), lambda: [encrypt(c, salt) for c in chunks])
+    return Response(batch_response_body([r + (seconds,) for r in results], PORT), mimetype=BATCH_MIME,
+                    headers={"Server-Timing": server_timing(aes=seconds)})
+
+if __name__ == "__main__":
+    url = advertise_url(PORT)
+    info = {"cores": STUB_SLOTS, "bench_mbps": STUB_MBPS, "capacity_mbps": STUB_MBPS * STUB_SLOTS}
+    start_heartbeats(url, load_report, info, telemetry=TelemetrySender(url, load_report))
+    print(f"[Stub {PORT}] {STUB_LATENCY * 1000:.1f} ms + {STUB_MBPS} MB/s, {STUB_SLOTS} slots")
+    app.run(host="0.0.0.0", port=PORT, threaded=True)
@@ -0,0 +1,131 @@
+# hedging.py → Hedged (speculative) re-dispatch of straggler chunks
+#
+# Each /task call runs in a helper thread. If it is still outstanding after the node's
+# recent p95 latency (x HEDGE_FACTOR), a copy is sent to the least-loaded other node;
+# whichever answers first wins and the other answer is ignored when it arrives.
+# Hedges are capped at HEDGE_BUDGET of all calls so a slow cluster is not doubled.
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from dispatcher import MAX_IN_FLIGHT
+
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "1") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_FACTOR = float(os.environ.get("HEDGE_FACTOR", "1.0"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.05"))   # s
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "10"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.1"))          # max share of hedged calls
+LATENCY_HISTORY = int(os.environ.get("LATENCY_HISTORY", "100"))      # samples kept per node
+
+
+class LatencyTracker:
+    """Recent successful /task latencies per node."""
+
+    def __init__(self, size=LATENCY_HISTORY):
+        self.size = size
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, node, seconds):
+        with self.lock:
+            self.samples.setdefault(node, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, node, pct, min_samples=1):
+        with self.lock:
+            values = sorted(self.samples.get(node, ()))
+        if len(values) < min_samples:
+            return None
+        return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+    def snapshot(self):
+        with self.lock:
+            return {node: list(v) for node, v in self.samples.items()}
+
+
+class Hedger:
+    def __init__(self, tracker=None, workers=4 * MAX_IN_FLIGHT):
+        self.tracker = tracker or LatencyTracker()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.fired = 0          # backups sent
+        self.backup_wins = 0    # backup answered first
+        self.saved = 0.0        # seconds gained vs. the primary's eventual answer
+        self.skipped = 0        # straggler seen but no free alternate / over budget
+
+    def threshold(self, node):
+        p = self.tracker.percentile(node, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+        return None if p is None else max(p * HEDGE_FACTOR, HEDGE_MIN_DELAY)
+
+    def _timed(self, node, send):
+        start = time.time()
+        data = send(node)
+        self.tracker.record(node, time.time() - start)
+        return data
+
+    def call(self, node, send, alternate):
+        """Run send(node), hedging to alternate() if it straggles.
+
+        send(node) performs one /task call and raises on failure; alternate() returns
+        another node to try (or None). Returns (winning node, data).
+        """
+        with self.lock:
+            self.calls += 1
+            in_budget = self.fired < HEDGE_BUDGET * self.calls
+        start = time.time()
+        primary = self.pool.submit(self._timed, node, send)
+        delay = self.threshold(node) if HEDGE_ENABLED else None
+        if delay is None:
+            return node, primary.result()
+        try:
+            return node, primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        backup_node = alternate() if in_budget else None
+        if backup_node is None:
+            with self.lock:
+                self.skipped += 1
+            return node, primary.result()
+
+        with self.lock:
+            self.fired += 1
+        backup = self.pool.submit(self._timed, backup_node, send)
+        owners = {primary: node, backup: backup_node}
+        pending, error = set(owners), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is not None:
+                    error = fut.exception()
+                    continue
+                if fut is backup:
+                    won_at = time.time()
+                    with self.lock:
+                        self.backup_wins += 1
+                    primary.add_done_callback(lambda p: self._credit(p, won_at))
+                return owners[fut], fut.result()
+        raise error
+
+    def _credit(self, primary, won_at):
+        if primary.exception() is None:
+            with self.lock:
+                self.saved += time.time() - won_at
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "enabled": HEDGE_ENABLED,
+                "calls": self.calls,
+                "hedges_fired": self.fired,
+                "hedge_rate": self.fired / self.calls if self.calls else 0.0,
+                "backup_wins": self.backup_wins,
+                "seconds_saved": self.saved,
+                "skipped": self.skipped,
+            }
+        stats["thresholds"] = {n: self.threshold(n) for n in self.tracker.snapshot()}
+        return stats
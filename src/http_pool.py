@@ -0,0 +1,89 @@
+# http_pool.py → Shared keep-alive HTTP session for balancers and client
+#
+# One requests.Session per process; urllib3 keeps a separate connection pool per
+# host:port, so every fog node (or load balancer) gets its own set of reusable sockets.
+#
+# A socket is only reused if the server keeps it open. Flask's built-in server (app.run,
+# Werkzeug) answers every request with "Connection: close", so with it each request still
+# opens a new TCP connection and /pool_stats shows no hits. Reuse needs a keep-alive
+# capable WSGI server in front of the fog nodes and balancers (gunicorn, waitress, ...).
+import os
+import threading
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+POOL_SIZE = int(os.environ.get("POOL_SIZE", "16"))          # kept-alive sockets per host
+POOL_HOSTS = int(os.environ.get("POOL_HOSTS", "32"))        # number of per-host pools cached
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", "60"))  # s, /task and /task_batch calls
+
+_connects = Counter()   # "host:port" -> TCP connections opened (reconnects of a pooled one too)
+_connects_lock = threading.Lock()
+
+
+def _count_connect(conn):
+    with _connects_lock:
+        _connects[f"{conn.host}:{conn.port}"] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        _count_connect(self)
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _count_connect(self)
+
+
+class _HTTPPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _HTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPPool, "https": _HTTPSPool}
+
+
+_adapter = _CountingAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+session = requests.Session()
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+
+def get(url, timeout=READ_TIMEOUT, **kwargs):
+    return session.get(url, timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+
+
+def post(url, timeout=READ_TIMEOUT, **kwargs):
+    return session.post(url, timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+
+
+def pool_stats():
+    """Per-host pool usage: a miss opened a TCP connection, a hit reused a kept-alive one."""
+    stats = {}
+    pools = _adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host = f"{pool.host}:{pool.port}"
+        with _connects_lock:
+            misses = _connects[host]
+        stats[host] = {
+            "requests": pool.num_requests,
+            "hits": max(pool.num_requests - misses, 0),
+            "misses": misses,
+        }
+    return stats
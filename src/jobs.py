@@ -0,0 +1,327 @@
+# jobs.py → Per-upload job state and the asynchronous job API of the load balancers
+#
+# Every /process_file request gets its own Job: result buffer (ResultSpool + metadata),
+# progress counters and timings. Nothing about an upload lives in module globals, so
+# concurrent uploads on the same balancer cannot clobber each other.
+#
+# Async flow (see job_routes):
+#   POST /jobs                         → {"job_id"}
+#   POST /process_file?job_id=<id>     → 202 as soon as the upload has been read
+#   GET  /jobs/<id>/events             → Server-Sent Events: "chunk" per finished chunk,
+#                                        "progress", then "done" or "failed"
+#   GET  /jobs/<id>/result             → frames / JSON body, same as synchronous /process_file
+#
+# A job belongs to one trace (the client's `traceparent`, or a new one): each result entry
+# carries its chunk's stage breakdown and result bodies a per-file summary (see tracing.py).
+# It also belongs to a tenant (X-Tenant header, "default" without one), which scopes the
+# dedup cache (see dedup.py).
+import json
+import os
+import threading
+import time
+import uuid
+
+from flask import Blueprint, Response, jsonify, request
+
+import lb_metrics
+from chunk_transport import FRAMES_MIME, ResultSpool, iter_frames, results_as_json, wants
+from tracing import ChunkTrace, new_trace_id, summarize, trace_id_from
+
+JOB_TTL = float(os.environ.get("JOB_TTL", "600"))  # finished jobs stay visible this long (s)
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "10"))
+RESULT_WAIT = float(os.environ.get("RESULT_WAIT", "30"))
+TENANT_HEADER = "X-Tenant"
+DEFAULT_TENANT = "default"
+
+
+class Job:
+    def __init__(self, file_name=None, trace_id=None, tenant=None):
+        self.id = uuid.uuid4().hex
+        self.file_name = file_name
+        self.trace_id = trace_id or new_trace_id()
+        self.tenant = tenant or DEFAULT_TENANT
+        self.spool = ResultSpool()
+        self.results = []              # metadata entries, in completion order
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.chunks_received = 0
+        self.bytes_received = 0
+        self.chunk_bounds = []         # (plaintext offset, size) of each chunk received
+        self.chunk_times = []          # (received at, upload time) of each chunk received
+        self.chunks_done = 0
+        self.chunks_failed = 0
+        self.completed = set()         # chunk numbers that have a result entry
+        self.upload_complete = False
+        self.error = None
+        self.collected = False         # result body already sent (spool closed)
+        self.created = time.time()
+        self.upload_done_at = None
+        self.finished_at = None
+
+    def chunk_received(self, size, upload_time=0.0):
+        with self.lock:
+            self.chunk_bounds.append((self.bytes_received, size))
+            self.chunk_times.append((time.time(), upload_time))
+            self.chunks_received += 1
+            self.bytes_received += size
+        lb_metrics.chunk_bytes.observe(size)
+
+    def chunk_trace(self, idx):
+        """ChunkTrace of chunk `idx`, its upload stage already filled in."""
+        received_at, upload_time = self.chunk_times[idx]
+        trace = ChunkTrace(self.trace_id, received_at)
+        trace.stages["upload"] = upload_time
+        return trace
+
+    def upload_finished(self):
+        with self.lock:
+            self.upload_complete = True
+            self.upload_done_at = time.time()
+            if self.chunks_done == self.chunks_received:
+                self._finish()
+            self.changed.notify_all()
+
+    def fail(self, reason):
+        with self.lock:
+            self.error = reason
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def add_result(self, entry):
+        """Store one chunk result (ciphertext goes to the spool) and return its metadata entry.
+
+        The chunk's plaintext offset and size are added: chunks need not all be the same size.
+        """
+        offset, size = self.chunk_bounds[entry["chunk"]]
+        entry = self.spool.add(dict(entry, offset=offset, size=size))
+        with self.lock:
+            self.results.append(entry)
+            self.completed.add(entry["chunk"])
+            self.chunks_done += 1
+            if entry.get("error"):
+                self.chunks_failed += 1
+            if self.upload_complete and self.chunks_done == self.chunks_received:
+                self._finish()
+            self.changed.notify_all()
+        return entry
+
+    def has_result(self, idx):
+        with self.lock:
+            return idx in self.completed
+
+    def _finish(self):
+        # every chunk has a result (caller holds the lock)
+        self.finished_at = time.time()
+        lb_metrics.file_seconds.observe(self.finished_at - self.created)
+
+    def wait_update(self, seen, timeout):
+        """Wait until more than `seen` results exist or the job finished.
+
+        Returns (new entries, finished).
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.results) > seen or self.finished_at, timeout)
+            return list(self.results[seen:]), self.finished_at is not None
+
+    def wait_done(self, timeout):
+        with self.changed:
+            return self.changed.wait_for(lambda: self.finished_at is not None, timeout)
+
+    def sorted_results(self):
+        with self.lock:
+            return sorted(self.results, key=lambda r: r["chunk"])
+
+    def node_distribution(self):
+        usage = {}
+        with self.lock:
+            for r in self.results:
+                if "node_used" in r:
+                    usage[r["node_used"]] = usage.get(r["node_used"], 0) + 1
+        return usage
+
+    def progress(self):
+        with self.lock:
+            now = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "file_name": self.file_name,
+                "trace_id": self.trace_id,
+                "tenant": self.tenant,
+                "chunks_received": self.chunks_received,
+                "chunks_done": self.chunks_done,
+                "chunks_failed": self.chunks_failed,
+                "bytes_received": self.bytes_received,
+                "upload_complete": self.upload_complete,
+                "done": self.finished_at is not None,
+                "error": self.error,
+                "elapsed": now - self.created,
+                "upload_time": (self.upload_done_at - self.created) if self.upload_done_at else None,
+            }
+
+
+class JobRegistry:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create(self, file_name=None, trace_id=None, tenant=None):
+        job = Job(file_name, trace_id, tenant)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def for_upload(self, job_id=None, trace_id=None, tenant=None):
+        """Job an upload should feed: the one named by `job_id` (async flow) or a new one
+        in trace `trace_id` for `tenant`.
+
+        None if `job_id` is unknown or that job already received an upload.
+        """
+        if job_id is None:
+            return self.create(trace_id=trace_id, tenant=tenant)
+        job = self.get(job_id)
+        if job is None or job.chunks_received or job.upload_complete or job.finished_at:
+            return None
+        return job
+
+    def snapshot(self):
+        with self.lock:
+            self._prune()
+            return [job.progress() for job in self.jobs.values()]
+
+    def _prune(self):
+        # Finished jobs, and jobs that were created but never received an upload
+        now = time.time()
+        for job_id in [j for j, job in self.jobs.items()
+                       if now - (job.finished_at or job.created) > JOB_TTL
+                       and (job.finished_at or not job.chunks_received)]:
+            self.jobs[job_id].spool.close()
+            del self.jobs[job_id]
+
+
+def guarded(process_chunk):
+    """process_chunk(job, idx, chunk) that always leaves a result entry for its chunk: an
+    unexpected exception becomes an error entry, so the job still completes."""
+    def run(job, idx, chunk):
+        try:
+            return process_chunk(job, idx, chunk)
+        except Exception as e:
+            print(f"[Jobs] chunk {idx} of job {job.id} failed: {type(e).__name__}: {e}")
+            if not job.has_result(idx):
+                return job.add_result({"chunk": idx, "error": f"internal error: {e}"})
+    return run
+
+
+def dispatch_upload(job, upload, chunk_size, dispatcher, process_chunk):
+    """Submit process_chunk(job, idx, chunk) for each chunk of `upload` as it arrives.
+
+    `chunk_size` is a size or a list of per-chunk sizes (see UploadStream.chunks).
+    An exception in process_chunk becomes an error entry for its chunk (see guarded).
+
+    Blocks until the whole upload has been read (dispatcher backpressure included) and
+    returns the futures in chunk order. A broken upload fails the job and re-raises.
+    """
+    futures = []
+    process_chunk = guarded(process_chunk)
+    mark = time.time()
+    try:
+        for idx, chunk in enumerate(upload.chunks(chunk_size)):
+            job.file_name = upload.filename
+            job.chunk_received(len(chunk), time.time() - mark)
+            futures.append(dispatcher.submit(job, process_chunk, job, idx, chunk))
+            mark = time.time()
+    except Exception as e:
+        job.fail(f"upload interrupted: {e}")
+        raise
+    job.file_name = upload.filename
+    job.upload_finished()
+    return futures
+
+
+def wants_async(req):
+    """Async mode: the caller attached the upload to a job it created, or sent Prefer: respond-async."""
+    return "job_id" in req.args or "respond-async" in req.headers.get("Prefer", "")
+
+
+def job_response(job, req, meta=None):
+    """Frames or legacy JSON body with the job's results in chunk order (consumes the spool)."""
+    job.collected = True
+    results = job.sorted_results()
+    wall = (job.finished_at or time.time()) - job.created
+    meta = dict(meta or {}, file_name=job.file_name, job_id=job.id,
+                trace=summarize(results, job.trace_id, wall))
+    if wants(req, FRAMES_MIME):
+        return Response(iter_frames(meta, results, job.spool), mimetype=FRAMES_MIME)
+    return jsonify(dict(meta, results=results_as_json(results, job.spool)))
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_events(job):
+    seen = 0
+    while True:
+        new, finished = job.wait_update(seen, SSE_HEARTBEAT)
+        if not new and not finished:
+            yield ": ping\n\n"  # keeps proxies and read timeouts from closing the stream
+            continue
+        for entry in new:
+            yield sse("chunk", entry)
+        seen += len(new)
+        yield sse("progress", job.progress())
+        if finished:
+            yield sse("failed" if job.error else "done", job.progress())
+            return
+
+
+def job_routes(jobs, meta=None):
+    """Blueprint exposing `jobs` over HTTP; `meta` is merged into result bodies."""
+    bp = Blueprint("jobs", __name__)
+
+    def lookup(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return None, (jsonify({"error": "unknown job"}), 404)
+        return job, None
+
+    @bp.route("/jobs", methods=["POST"])
+    def create_job():
+        job = jobs.create(trace_id=trace_id_from(request),
+                          tenant=request.headers.get(TENANT_HEADER))
+        return jsonify({"job_id": job.id, "trace_id": job.trace_id}), 201
+
+    @bp.route("/jobs", methods=["GET"])
+    def list_jobs():
+        return jsonify(jobs.snapshot())
+
+    @bp.route("/jobs/<job_id>")
+    def job_status(job_id):
+        job, err = lookup(job_id)
+        return err or jsonify(job.progress())
+
+    @bp.route("/jobs/<job_id>/events")
+    def job_events(job_id):
+        job, err = lookup(job_id)
+        if err:
+            return err
+        return Response(iter_events(job), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    @bp.route("/jobs/<job_id>/result")
+    def job_result(job_id):
+        job, err = lookup(job_id)
+        if err:
+            return err
+        if not job.wait_done(RESULT_WAIT):
+            return jsonify(dict(job.progress(), error="job still running")), 409
+        if job.collected:
+            return jsonify({"error": "result already collected"}), 410
+        body_meta = dict(meta or {}, node_distribution=job.node_distribution())
+        return job_response(job, request, body_meta)
+
+    return bp
@@ -0,0 +1,33 @@
+# lb_metrics.py → Prometheus metrics of the load balancers (served by metrics.metrics_routes)
+#
+# Imported only by balancer-side modules, so fog nodes do not export always-zero lb_*
+# series. The only per-node label is the node URL, removed when the node leaves
+# (forget_node), so cardinality stays bounded by the cluster.
+from prometheus_client import Counter, Histogram
+
+from metrics import FILE_BUCKETS, LATENCY_BUCKETS, SIZE_BUCKETS
+
+node_request_seconds = Histogram(
+    "lb_node_request_seconds", "Successful /task and /task_batch calls, as timed by the balancer",
+    ["node"], buckets=LATENCY_BUCKETS)
+chunk_seconds = Histogram(
+    "lb_chunk_seconds", "Time from a dispatcher worker taking a chunk to its result "
+    "(retries and hedges included)", buckets=LATENCY_BUCKETS)
+chunk_queue_seconds = Histogram(
+    "lb_chunk_queue_seconds", "Time a received chunk waits for a dispatcher worker",
+    buckets=LATENCY_BUCKETS)
+chunk_bytes = Histogram("lb_chunk_bytes", "Plaintext bytes per chunk", buckets=SIZE_BUCKETS)
+file_seconds = Histogram(
+    "lb_file_seconds", "Job creation to last chunk encrypted, per file", buckets=FILE_BUCKETS)
+dedup_lookups = Counter(
+    "lb_dedup_lookups", "Chunks looked up in the dedup cache, by result (hit or miss)", ["result"])
+dedup_saved_bytes = Counter(
+    "lb_dedup_saved_bytes", "Plaintext bytes answered from the dedup cache instead of a fog node")
+
+
+def forget_node(node):
+    """Drop the per-node series of a node that left."""
+    try:
+        node_request_seconds.remove(node)
+    except KeyError:
+        pass
@@ -1,121 +1,315 @@
 # load_balancer_aes_optimized.py → Smart Load Balancer (Algo)
 from flask import Flask, request, jsonify
-import requests, time
-from threading import Lock
+import time, os
+import http_pool
+import lb_metrics
+import metrics
+from collections import deque
+from threading import Lock, Condition
+from chunk_pipeline import ChunkPipeline
+from circuit_breaker import BreakerBoard
+from compression import Compressor
+from dedup import DedupCache
+from dispatcher import ChunkDispatcher, MAX_IN_FLIGHT_PER_NODE
+from hedging import Hedger
+from jobs import (TENANT_HEADER, JobRegistry, dispatch_upload, job_response, job_routes,
+                  wants_async)
+from membership import SEED_NODES, Membership, membership_routes
+from scheduling import ChunkSizer, MakespanPlan
+from telemetry import TelemetryListener
+from tracing import trace_id_from
+from upload_stream import UploadStream
 
 app = Flask(__name__)
 
-FOG_NODES = [
-    "http://172.20.10.5:5001",
-    "http://172.20.10.2:5002",
-    "http://172.20.10.6:5003",
-]
-
-node_kpi = {node: None for node in FOG_NODES}
-local_tasks = {node: 0 for node in FOG_NODES}
+node_kpi = {node: None for node in SEED_NODES}
+local_tasks = {node: 0 for node in SEED_NODES}
 ALPHA = 0.3
 LOCK = Lock()
+SLOTS = Condition(LOCK)  # signalled whenever a node frees an in-flight slot
+
+# In-flight limits: global (dispatcher workers shared by all uploads, MAX_IN_FLIGHT) and
+# per fog node (MAX_IN_FLIGHT_PER_NODE, enforced through local_tasks in acquire_node)
+dispatcher = ChunkDispatcher(SEED_NODES)
+hedger = Hedger()  # re-sends stragglers to another node (see hedging.py)
+breakers = BreakerBoard(SEED_NODES, "Smart LB")  # skips ejected nodes (see circuit_breaker.py)
+jobs = JobRegistry()
+app.register_blueprint(job_routes(jobs, {"load_balancer": "smart"}))
+# SCHEDULER=greedy scores each chunk on its own (select_node); SCHEDULER=makespan plans the
+# whole file over all nodes (see scheduling.MakespanPlan) and re-plans after every chunk
+SCHEDULER = os.environ.get("SCHEDULER", "greedy")
+sizer = ChunkSizer(SEED_NODES)         # node models (both modes) and per-file chunk sizes
+compressor = Compressor()              # optional compression before encryption (COMPRESSION)
+dedup = DedupCache()                   # convergent mode: repeated chunks skip dispatch (DEDUP)
+plans = {}                            # job id -> MakespanPlan of an upload in progress
+schedule_reports = deque(maxlen=50)   # predicted vs actual makespan of recent files
+
+# Fog nodes register themselves and heartbeat (see membership.py); their load snapshot is
+# pushed every few hundred ms over UDP (see telemetry.py), heartbeats being the fallback.
+# Readers never lock: a node's snapshot is only ever swapped whole, never mutated.
+HEALTH_MAX_AGE = float(os.environ.get("HEALTH_MAX_AGE", "3"))  # older snapshots count as offline
+
+def node_joined(node):
+    with LOCK:
+        node_kpi[node] = None  # (re)joining nodes are measured again
+        local_tasks.setdefault(node, 0)
+    dispatcher.add_node(node)
+    breakers.add_node(node)
+    sizer.add_node(node)
 
-def select_node(chunk_size):
-    untested = [n for n in FOG_NODES if node_kpi[n] is None]
+def node_left(node):
+    dispatcher.remove_node(node)
+    breakers.remove_node(node)
+    lb_metrics.forget_node(node)
+
+membership = Membership(SEED_NODES, "Smart LB", node_joined, node_left)
+app.register_blueprint(membership_routes(membership))
+app.register_blueprint(metrics.metrics_routes())  # Prometheus
+telemetry = TelemetryListener(membership)
+
+def fresh_health(node, now):
+    """Latest load snapshot for `node`, or None if missing or older than HEALTH_MAX_AGE."""
+    h = membership.load(node)
+    if h is None or now - h["ts"] > HEALTH_MAX_AGE:
+        return None
+    return h
+
+def estimated_time(node, chunk_size):
+    """Encryption time of a chunk on `node` from its startup benchmark (None if unknown)."""
+    mbps = membership.info(node).get("bench_mbps")
+    return chunk_size / (1024 * 1024) / mbps if mbps else None
+
+def select_node(chunk_size, exclude=()):
+    candidates = [n for n in breakers.available()
+                  if n not in exclude and local_tasks[n] < MAX_IN_FLIGHT_PER_NODE]
+    if not candidates:
+        return None
+    # Nodes with neither a measured KPI nor a benchmark are tried once first
+    untested = [n for n in candidates
+                if node_kpi[n] is None and estimated_time(n, chunk_size) is None]
     if untested:
         return untested[0]
 
     scores = {}
-    with LOCK:
-        for node in FOG_NODES:
-            try:
-                r = requests.get(f"{node}/health", timeout=1.5)
-                health = r.json()
-                cpu = health.get("cpu_percent", 100)
-                ram = health.get("ram_percent", 100)
-                load = 1 + local_tasks[node]
-            except:
-                cpu = ram = 100
-                load = 999
-
-            size_factor = max(chunk_size / (50 * 1024 * 1024), 0.1)
-            base_time = node_kpi[node] or 10.0
-            score = base_time * load * (1 + cpu/200) * (1 + ram/200) * size_factor
-            scores[node] = score
+    now = time.time()
+    for node in candidates:
+        health = fresh_health(node, now)
+        if health is not None:
+            cpu = health.get("cpu_percent", 100)
+            ram = health.get("ram_percent", 100)
+            load = 1 + local_tasks[node] + health.get("queue_depth", 0)
+        else:
+            cpu = ram = 100
+            load = 999
+
+        size_factor = max(chunk_size / (50 * 1024 * 1024), 0.1)
+        base_time = node_kpi[node] or estimated_time(node, chunk_size) or 10.0
+        score = base_time * load * (1 + cpu/200) * (1 + ram/200) * size_factor
+        scores[node] = score
 
     return min(scores, key=scores.get)
 
+def try_acquire_node(chunk_size, exclude):
+    """Reserve a slot on the best free node not in `exclude`, or return None without waiting."""
+    node = select_node(chunk_size, exclude)
+    with SLOTS:
+        if node is not None and local_tasks[node] < MAX_IN_FLIGHT_PER_NODE:
+            local_tasks[node] += 1
+            return node
+    return None
+
+def acquire_node(chunk_size, exclude):
+    """Reserve an in-flight slot on the best node not in `exclude` (blocks while all are busy).
+
+    Returns None once every node is either in `exclude` or ejected by its circuit breaker;
+    nodes backing off after a 503 are waited for.
+    """
+    while True:
+        node = try_acquire_node(chunk_size, exclude)
+        if node is not None:
+            return node
+        if breakers.retry_in(exclude) is None:
+            return None
+        with SLOTS:
+            SLOTS.wait(timeout=0.2)
+
+def acquire_planned(plan, i):
+    """Reserve a slot on the node `plan` currently gives chunk i, waiting for it if busy.
+
+    The assignment is read again on every wake-up since completions re-plan; returns None if
+    the chunk is not planned or its node is no longer usable (greedy selection takes over).
+    """
+    while True:
+        node = plan.assigned(i)
+        if node is None or node not in local_tasks or not breakers.allow(node):
+            return None
+        with SLOTS:
+            if local_tasks[node] < MAX_IN_FLIGHT_PER_NODE:
+                local_tasks[node] += 1
+                return node
+            SLOTS.wait(timeout=0.2)
+
+def replan(plan):
+    nodes = [n for n in breakers.available() if n in sizer.models]
+    plan.replan(nodes, sizer.models)
+    with SLOTS:
+        SLOTS.notify_all()  # workers waiting in acquire_planned re-read their node
+
+def chunk_done(job, plan, i):
+    if plan.finished(i):
+        plan_finished(job, plan)
+    else:
+        replan(plan)
+
+def plan_finished(job, plan):
+    plans.pop(job.id, None)
+    report = dict(plan.report(), job_id=job.id, file_name=job.file_name)
+    schedule_reports.append(report)
+    print(f"[Smart LB] {job.file_name}: makespan predicted {report['predicted_makespan']:.2f}s, "
+          f"actual {report['actual_makespan']:.2f}s ({report['replans']} re-plans)")
+
+def release_node(node):
+    with SLOTS:
+        local_tasks[node] -= 1
+        SLOTS.notify_all()
+
+def acquire_chunk_node(job, i, size, tried):
+    """Slot for chunk i: the node its plan gives it first, else the best free node."""
+    plan = plans.get(job.id)
+    node = None
+    if plan is not None and not tried:
+        node = acquire_planned(plan, i)
+    if node is None:
+        node = acquire_node(size, tried)
+    if node is not None and plan is not None:
+        plan.started(i, node, sizer.models[node].predict(size))
+    return node
+
+def record_kpi(node, data, elapsed):
+    with LOCK:
+        old = node_kpi[node]
+        new_time = data.get("processing_time", elapsed)
+        node_kpi[node] = new_time if old is None else ALPHA * new_time + (1 - ALPHA) * old
+
+# dedup, compression, batching, hedging and retries (see chunk_pipeline.py); slots are
+# reserved by acquire_chunk_node / try_acquire_node and freed after each call
+pipeline = ChunkPipeline("Smart LB", breakers, sizer, hedger, compressor, dedup,
+                         acquire=acquire_chunk_node, alternate=try_acquire_node,
+                         release=release_node, on_success=record_kpi)
+
+def dispatch_chunk(job, i, chunk):
+    plan = plans.get(job.id)
+    try:
+        return pipeline.process_chunk(job, i, chunk)
+    finally:
+        if plan is not None:
+            chunk_done(job, plan, i)
+
 @app.route("/process_file", methods=["POST"])
 def process_file():
-    if "file" not in request.files:
+    upload = UploadStream(request)
+    if not upload.is_multipart():
         return jsonify({"error": "No file"}), 400
+    job = jobs.for_upload(request.args.get("job_id"), trace_id_from(request),
+                          request.headers.get(TENANT_HEADER))
+    if job is None:
+        return jsonify({"error": "unknown or already used job"}), 409
 
-    file = request.files["file"]
-    content = file.read()
-    chunk_size = 5 * 1024 * 1024
-    num_chunks = (len(content) + chunk_size - 1) // chunk_size
-    results = []
-
-    for i in range(num_chunks):
-        start = i * chunk_size
-        end = start + chunk_size
-        chunk = content[start:end]
-
-        tried = set()
-        while len(tried) < len(FOG_NODES):
-            node = select_node(len(chunk))
-            if node in tried:
-                node = [n for n in FOG_NODES if n not in tried][0]
-            tried.add(node)
-
-            total_start = time.time()
-            with LOCK:
-                local_tasks[node] += 1
+    # Chunk sizes are chosen per file from its announced size and the node models;
+    # makespan mode also plans their assignment before the first chunk arrives
+    size = upload.expected_size()
+    sizes = (dedup.chunk_sizes(size)
+             or sizer.sizes(size, breakers.available(), MAX_IN_FLIGHT_PER_NODE))
+    plan = None
+    if SCHEDULER == "makespan" and size:
+        plan = MakespanPlan(sizes, MAX_IN_FLIGHT_PER_NODE)
+        replan(plan)
+        plans[job.id] = plan
 
-            try:
-                resp = requests.post(f"{node}/task", data=chunk, timeout=60)
-                resp.raise_for_status()
-                data = resp.json()
-            except Exception as e:
-                with LOCK:
-                    local_tasks[node] -= 1
-                continue  # retry next node
-
-            elapsed = time.time() - total_start
-
-            with LOCK:
-                old = node_kpi[node]
-                new_time = data.get("processing_time", elapsed)
-                node_kpi[node] = new_time if old is None else ALPHA * new_time + (1 - ALPHA) * old
-                local_tasks[node] -= 1
-
-            port = node.split(":")[-1]
-            results.append({
-                "chunk": i,
-                "node_used": int(port),
-                "result": data["result"],
-                "key": data["key"],           # CRITICAL
-                "nonce": data["nonce"],       # CRITICAL
-                "processing_time": data.get("processing_time", 0),
-                "total_time": elapsed
-            })
-            break  # success
+    # Each chunk is dispatched as soon as it has been received;
+    # submit() blocks while this job's queue is full (backpressure on the upload)
+    try:
+        futures = dispatch_upload(job, upload, sizes, dispatcher, dispatch_chunk)
+    except Exception:
+        plans.pop(job.id, None)  # broken upload: the job has failed, drop its plan too
+        raise
+    if plan is not None and plan.upload_finished(job.chunks_received):
+        plan_finished(job, plan)
+    if upload.filename is None:
+        plans.pop(job.id, None)
+        job.fail("no file")
+        return jsonify({"error": "No file"}), 400
 
-        else:
-            # All nodes failed
-            results.append({"chunk": i, "error": "all nodes failed"})
+    # Async mode: progress and results are served by the /jobs routes
+    if wants_async(request):
+        return jsonify({"job_id": job.id}), 202
 
-    return jsonify({"results": results})
+    for f in futures:
+        f.result()
+    return job_response(job, request, {"schedule": plan.report()} if plan else None)
 
 @app.route("/nodes_status")
 def nodes_status():
     status = {}
-    for node in FOG_NODES:
-        try:
-            r = requests.get(f"{node}/health", timeout=2)
-            h = r.json()
-            status[node] = {k: h.get(k) for k in ["cpu_percent", "ram_percent", "tasks_running"]}
-            status[node]["kpi"] = round(node_kpi[node], 3) if node_kpi[node] else None
-        except:
+    now = time.time()
+    for node in membership.nodes():
+        h = fresh_health(node, now)
+        if h is None:
             status[node] = {"error": "offline"}
+            continue
+        status[node] = {k: h.get(k) for k in ["cpu_percent", "ram_percent", "tasks_running",
+                                              "queue_depth", "encrypt_mbps"]}
+        status[node]["kpi"] = round(node_kpi[node], 3) if node_kpi[node] else None
+        status[node]["age"] = round(now - h["ts"], 3)
     return jsonify(status)
 
+@app.route("/dispatch_stats")
+def dispatch_stats():
+    stats = dispatcher.stats()
+    stats["in_flight"] = dict(local_tasks)
+    return jsonify(stats)
+
+@app.route("/hedge_stats")
+def hedge_stats():
+    return jsonify(hedger.stats())
+
+@app.route("/breaker_stats")
+def breaker_stats():
+    return jsonify(breakers.stats())
+
+@app.route("/telemetry_stats")
+def telemetry_stats():
+    return jsonify(telemetry.stats())
+
+@app.route("/schedule_stats")
+def schedule_stats():
+    return jsonify({
+        "scheduler": SCHEDULER,
+        "planning": len(plans),
+        "models": sizer.stats()["models"],
+        "recent": list(schedule_reports),
+    })
+
+@app.route("/chunk_stats")
+def chunk_stats():
+    return jsonify(sizer.stats())
+
+@app.route("/batch_stats")
+def batch_stats():
+    return jsonify(pipeline.batcher.stats())
+
+@app.route("/compression_stats")
+def compression_stats():
+    return jsonify(compressor.stats())
+
+@app.route("/dedup_stats")
+def dedup_stats():
+    return jsonify(dedup.stats())
+
+@app.route("/pool_stats")
+def pool_stats():
+    return jsonify(http_pool.pool_stats())
+
 if __name__ == "__main__":
     print("Smart Load Balancer (Algo) → http://127.0.0.1:5006")
     app.run(host="0.0.0.0", port=5006, debug=False)
\ No newline at end of file
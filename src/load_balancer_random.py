@@ -1,97 +1,132 @@
 # lb_round_robin.py → Round Robin Load Balancer (Port 5007)
 from flask import Flask, request, jsonify
-import requests
-import threading
-import time
+import http_pool
+import lb_metrics
+import metrics
+from chunk_pipeline import ChunkPipeline
+from circuit_breaker import BreakerBoard
+from compression import Compressor
+from dedup import DedupCache
+from dispatcher import ChunkDispatcher, MAX_IN_FLIGHT_PER_NODE
+from hedging import Hedger
+from jobs import (TENANT_HEADER, JobRegistry, dispatch_upload, job_response, job_routes,
+                  wants_async)
+from membership import SEED_NODES, Membership, membership_routes
+from scheduling import RR_STRATEGY, ChunkSizer, RoundRobin
+from tracing import trace_id_from
+from upload_stream import UploadStream
 
 app = Flask(__name__)
 
-FOG_NODES = [
-    "http://172.20.10.2:5001",
-    "http://172.20.10.3:5002",
-    "http://172.20.10.6:5003",
-]
-
-CHUNK_SIZE = 5 * 1024 * 1024
-results = []
-results_lock = threading.Lock()
-
-# --- Round Robin counter ---
-rr_index = 0
-rr_lock = threading.Lock()
-
-def select_node_rr():
-    global rr_index
-    with rr_lock:
-        node = FOG_NODES[rr_index]
-        rr_index = (rr_index + 1) % len(FOG_NODES)
-    return node
-
-def process_chunk(idx: int, chunk_data: bytes):
-    node = select_node_rr()
-    start_time = time.time()
-
-    try:
-        resp = requests.post(f"{node}/task", data=chunk_data, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()  
-    except Exception as e:
-        print(f"[RR LB] Error on node {node}: {e}")
-        data = {
-            "result": None,
-            "key": None,
-            "nonce": None,
-            "processing_time": 0,
-            "node_used": node.split(":")[-1],
-            "error": "failed"
-        }
-
-    total_time = time.time() - start_time
-
-    result_entry = {
-        "chunk": idx,
-        "node_used": int(data.get("node_used", node.split(":")[-1])),
-        "result": data.get("result"),
-        "key": data.get("key"),
-        "nonce": data.get("nonce"),
-        "processing_time": data.get("processing_time", 0),
-        "total_time": total_time
-    }
-
-    with results_lock:
-        results.append(result_entry)
+# Bounded worker pool + per-node caps (see dispatcher.py for the env settings)
+dispatcher = ChunkDispatcher(SEED_NODES)
+hedger = Hedger()  # re-sends stragglers to another node (see hedging.py)
+breakers = BreakerBoard(SEED_NODES, "RR LB")  # skips ejected nodes (see circuit_breaker.py)
+sizer = ChunkSizer(SEED_NODES)  # per-file chunk sizes from measured node speed (see scheduling.py)
+compressor = Compressor()  # optional compression before encryption (see compression.py)
+dedup = DedupCache()  # convergent mode: repeated chunks skip dispatch (see dedup.py)
+jobs = JobRegistry()
+app.register_blueprint(job_routes(jobs, {"load_balancer": "random"}))
+
+# --- Fog nodes register themselves and heartbeat (see membership.py) ---
+def node_joined(node):
+    dispatcher.add_node(node)
+    breakers.add_node(node)
+    sizer.add_node(node)
+
+def node_left(node):
+    dispatcher.remove_node(node)
+    breakers.remove_node(node)
+    lb_metrics.forget_node(node)
+    rotation.forget(node)
+
+membership = Membership(SEED_NODES, "RR LB", node_joined, node_left)
+app.register_blueprint(membership_routes(membership))
+app.register_blueprint(metrics.metrics_routes())  # Prometheus
+
+# --- Round Robin, weighted by capacity unless RR_STRATEGY=plain (see scheduling.py) ---
+rotation = RoundRobin()
+
+def select_node_rr(exclude=()):
+    """Next node whose circuit is not open, skipping `exclude` (None if none is left)."""
+    return rotation.pick(membership.nodes(), breakers.allow, membership.info, exclude)
+
+# dedup, compression, batching, hedging and retries (see chunk_pipeline.py)
+pipeline = ChunkPipeline(
+    "RR LB", breakers, sizer, hedger, compressor, dedup,
+    acquire=lambda job, idx, size, tried: select_node_rr(exclude=tried),
+    alternate=lambda size, exclude: dispatcher.least_loaded(
+        exclude=exclude.union(breakers.unavailable())),
+    node_slot=dispatcher.node_slot)
+
 
 @app.route("/process_file", methods=["POST"])
 def process_file():
-    global results
-    results = []
-
-    if "file" not in request.files:
+    upload = UploadStream(request)
+    if not upload.is_multipart():
         return jsonify({"error": "Aucun fichier reçu"}), 400
+    job = jobs.for_upload(request.args.get("job_id"), trace_id_from(request),
+                          request.headers.get(TENANT_HEADER))
+    if job is None:
+        return jsonify({"error": "unknown or already used job"}), 409
+
+    # Each chunk is dispatched as soon as it has been received;
+    # submit() blocks while this job's queue is full (backpressure on the upload)
+    # Chunk sizes are chosen per file from its announced size and the measured nodes
+    size = upload.expected_size()
+    sizes = (dedup.chunk_sizes(size)
+             or sizer.sizes(size, breakers.available(), MAX_IN_FLIGHT_PER_NODE))
+    futures = dispatch_upload(job, upload, sizes, dispatcher, pipeline.process_chunk)
+    if upload.filename is None:
+        job.fail("no file")
+        return jsonify({"error": "Aucun fichier reçu"}), 400
+
+    # Async mode: progress and results are served by the /jobs routes
+    if wants_async(request):
+        return jsonify({"job_id": job.id}), 202
 
-    file = request.files["file"]
-    file_content = file.read()
+    for f in futures:
+        f.result()
+    return job_response(job, request)
 
-    chunks = [
-        file_content[i:i + CHUNK_SIZE]
-        for i in range(0, len(file_content), CHUNK_SIZE)
-    ]
+@app.route("/health")
+def health():
+    return jsonify({"status": "ok", "type": "round_robin_lb", "strategy": RR_STRATEGY, "port": 5007})
 
-    threads = []
-    for idx, chunk in enumerate(chunks):
-        t = threading.Thread(target=process_chunk, args=(idx, chunk))
-        t.start()
-        threads.append(t)
+@app.route("/dispatch_stats")
+def dispatch_stats():
+    return jsonify(dispatcher.stats())
 
-    for t in threads:
-        t.join()
+@app.route("/hedge_stats")
+def hedge_stats():
+    return jsonify(hedger.stats())
 
-    sorted_results = sorted(results, key=lambda x: x["chunk"])
-    return jsonify({"results": sorted_results})
+@app.route("/breaker_stats")
+def breaker_stats():
+    return jsonify(breakers.stats())
+
+@app.route("/chunk_stats")
+def chunk_stats():
+    return jsonify(sizer.stats())
+
+
+@app.route("/batch_stats")
+def batch_stats():
+    return jsonify(pipeline.batcher.stats())
+
+@app.route("/compression_stats")
+def compression_stats():
+    return jsonify(compressor.stats())
+
+@app.route("/dedup_stats")
+def dedup_stats():
+    return jsonify(dedup.stats())
+
+
+@app.route("/pool_stats")
+def pool_stats():
+    return jsonify(http_pool.pool_stats())
 
-@app.route("/health")
-def health():
-    return jsonify({"status": "ok", "type": "round_robin_lb", "port": 5007})
 
 if __name__ == "__main__":
     print("Round Robin Load Balancer → http://127.0.0.1:5007")
@@ -1,107 +1,99 @@
 # lb_roundrobin.py → Round-Robin Load Balancer (Port 5007)
 from flask import Flask, request, jsonify
-import requests
-import threading
-import time
-import itertools
+import http_pool
+import lb_metrics
+import metrics
+from chunk_pipeline import ChunkPipeline
+from circuit_breaker import BreakerBoard
+from compression import Compressor
+from dedup import DedupCache
+from dispatcher import ChunkDispatcher, MAX_IN_FLIGHT_PER_NODE
+from hedging import Hedger
+from jobs import (TENANT_HEADER, JobRegistry, dispatch_upload, job_response, job_routes,
+                  wants_async)
+from membership import SEED_NODES, Membership, membership_routes
+from scheduling import RR_STRATEGY, ChunkSizer, RoundRobin
+from tracing import trace_id_from
+from upload_stream import UploadStream
 
 app = Flask(__name__)
 
-FOG_NODES = [
-    "http://172.20.10.2:5001",
-    "http://172.20.10.3:5002",
-    "http://172.20.10.6:5003",
-]
-
-CHUNK_SIZE = 5 * 1024 * 1024  # 5 MB chunks
-results = []
-results_lock = threading.Lock()
-
-# Global round-robin iterator (thread-safe with lock when advancing)
-node_cycle = itertools.cycle(FOG_NODES)
-cycle_lock = threading.Lock()
-
-def select_node_roundrobin():
-    with cycle_lock:
-        return next(node_cycle)
-
-def process_chunk(idx: int, chunk_data: bytes):
-    node = select_node_roundrobin()
-    start_time = time.time()
-
-    try:
-        resp = requests.post(f"{node}/task", data=chunk_data, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        print(f"[RoundRobin LB] Error on node {node}: {e}")
-        data = {
-            "result": None,
-            "key": None,
-            "nonce": None,
-            "processing_time": 0,
-            "node_used": node.split(":")[-1],
-            "error": "failed"
-        }
-
-    total_time = time.time() - start_time
-
-    result_entry = {
-        "chunk": idx,
-        "node_used": int(data.get("node_used", node.split(":")[-1])),
-        "result": data.get("result"),           # encrypted chunk (hex)
-        "key": data.get("key"),                 # CRITICAL: forward encryption key
-        "nonce": data.get("nonce"),             # CRITICAL: forward nonce
-        "processing_time": data.get("processing_time", 0),
-        "total_time": total_time
-    }
-
-    with results_lock:
-        results.append(result_entry)
+# Bounded worker pool + per-node caps (see dispatcher.py for the env settings)
+dispatcher = ChunkDispatcher(SEED_NODES)
+hedger = Hedger()  # re-sends stragglers to another node (see hedging.py)
+breakers = BreakerBoard(SEED_NODES, "RoundRobin LB")  # skips ejected nodes (see circuit_breaker.py)
+sizer = ChunkSizer(SEED_NODES)  # per-file chunk sizes from measured node speed (see scheduling.py)
+compressor = Compressor()  # optional compression before encryption (see compression.py)
+dedup = DedupCache()  # convergent mode: repeated chunks skip dispatch (see dedup.py)
+jobs = JobRegistry()
+app.register_blueprint(job_routes(jobs, {"load_balancer": "round-robin"}))
+
+# Fog nodes register themselves and heartbeat (see membership.py)
+def node_joined(node):
+    dispatcher.add_node(node)
+    breakers.add_node(node)
+    sizer.add_node(node)
+
+def node_left(node):
+    dispatcher.remove_node(node)
+    breakers.remove_node(node)
+    lb_metrics.forget_node(node)
+    rotation.forget(node)
+
+membership = Membership(SEED_NODES, "RoundRobin LB", node_joined, node_left)
+app.register_blueprint(membership_routes(membership))
+app.register_blueprint(metrics.metrics_routes())  # Prometheus
+
+# Round-robin over the live node list, weighted by capacity unless RR_STRATEGY=plain
+rotation = RoundRobin()
+
+def select_node_roundrobin(exclude=()):
+    """Next node in the cycle whose circuit is not open (None if none is left)."""
+    return rotation.pick(membership.nodes(), breakers.allow, membership.info, exclude)
+
+# dedup, compression, batching, hedging and retries (see chunk_pipeline.py)
+pipeline = ChunkPipeline(
+    "RoundRobin LB", breakers, sizer, hedger, compressor, dedup,
+    acquire=lambda job, idx, size, tried: select_node_roundrobin(exclude=tried),
+    alternate=lambda size, exclude: dispatcher.least_loaded(
+        exclude=exclude.union(breakers.unavailable())),
+    node_slot=dispatcher.node_slot)
 
 
 @app.route("/process_file", methods=["POST"])
 def process_file():
-    global results
-    results = []  # Reset results for new request
-
-    if "file" not in request.files:
+    upload = UploadStream(request)
+    if not upload.is_multipart():
+        return jsonify({"error": "Aucun fichier reçu"}), 400
+    job = jobs.for_upload(request.args.get("job_id"), trace_id_from(request),
+                          request.headers.get(TENANT_HEADER))
+    if job is None:
+        return jsonify({"error": "unknown or already used job"}), 409
+
+    # Each chunk is dispatched as soon as it has been received;
+    # submit() blocks while this job's queue is full (backpressure on the upload)
+    # Chunk sizes are chosen per file from its announced size and the measured nodes
+    size = upload.expected_size()
+    sizes = (dedup.chunk_sizes(size)
+             or sizer.sizes(size, breakers.available(), MAX_IN_FLIGHT_PER_NODE))
+    futures = dispatch_upload(job, upload, sizes, dispatcher, pipeline.process_chunk)
+    if upload.filename is None:
+        job.fail("no file")
         return jsonify({"error": "Aucun fichier reçu"}), 400
 
-    file = request.files["file"]
-    file_content = file.read()
-
-    # Split file into chunks in memory
-    chunks = [
-        file_content[i:i + CHUNK_SIZE]
-        for i in range(0, len(file_content), CHUNK_SIZE)
-    ]
-
-    threads = []
-    for idx, chunk in enumerate(chunks):
-        t = threading.Thread(target=process_chunk, args=(idx, chunk))
-        t.start()
-        threads.append(t)
-
-    # Wait for all chunks to be processed
-    for t in threads:
-        t.join()
+    # Async mode: progress and results are served by the /jobs routes
+    if wants_async(request):
+        return jsonify({"job_id": job.id}), 202
 
-    # Sort results by chunk index to preserve order
-    sorted_results = sorted(results, key=lambda x: x["chunk"])
+    for f in futures:
+        f.result()
 
     # Optional: Print distribution summary
-    node_usage = {}
-    for r in sorted_results:
-        node = r["node_used"]
-        node_usage[node] = node_usage.get(node, 0) + 1
+    node_usage = job.node_distribution()
     print(f"[RoundRobin LB] Node distribution: {node_usage}")
 
-    return jsonify({
-        "results": sorted_results,
-        "load_balancer": "round-robin",
-        "node_distribution": node_usage
-    })
+    return job_response(job, request, {"load_balancer": "round-robin",
+                                       "node_distribution": node_usage})
 
 
 @app.route("/health")
@@ -109,10 +101,45 @@ def health():
     return jsonify({
         "status": "ok",
         "type": "roundrobin_lb",
+        "strategy": RR_STRATEGY,
         "port": 5007,
-        "nodes": FOG_NODES
+        "nodes": membership.nodes()
     })
 
+@app.route("/dispatch_stats")
+def dispatch_stats():
+    return jsonify(dispatcher.stats())
+
+@app.route("/hedge_stats")
+def hedge_stats():
+    return jsonify(hedger.stats())
+
+@app.route("/breaker_stats")
+def breaker_stats():
+    return jsonify(breakers.stats())
+
+@app.route("/chunk_stats")
+def chunk_stats():
+    return jsonify(sizer.stats())
+
+
+@app.route("/batch_stats")
+def batch_stats():
+    return jsonify(pipeline.batcher.stats())
+
+@app.route("/compression_stats")
+def compression_stats():
+    return jsonify(compressor.stats())
+
+@app.route("/dedup_stats")
+def dedup_stats():
+    return jsonify(dedup.stats())
+
+
+@app.route("/pool_stats")
+def pool_stats():
+    return jsonify(http_pool.pool_stats())
+
 
 if __name__ == "__main__":
     print("Round-Robin Load Balancer → http://127.0.0.1:5007")
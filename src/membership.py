@@ -0,0 +1,213 @@
+# membership.py → Dynamic fog node membership (registration + heartbeats)
+#
+# Fog nodes announce themselves to every balancer listed in LOAD_BALANCERS:
+#   POST /register    {"url", "load", "info"}   on startup
+#   POST /heartbeat   {"url", "load", "info"}   every HEARTBEAT_INTERVAL; an unknown node is
+#                                               registered again (e.g. after a balancer restart)
+#   POST /deregister  {"url"}           on clean shutdown
+# A balancer evicts nodes that have not sent a heartbeat for NODE_TTL seconds, so new nodes
+# receive chunks as soon as they register and dead ones disappear without a restart.
+# FOG_NODES (comma-separated URLs) optionally seeds the list; seeds that never heartbeat are
+# evicted like any other node. "info" holds static facts measured at node startup (cores,
+# benchmarked MB/s, see fog_node.benchmark) used as scheduling weights. Balancers running a
+# TelemetryListener also get the node's load pushed over UDP between heartbeats (see
+# telemetry.py).
+import atexit
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask import Blueprint, jsonify, request
+
+import http_pool
+
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "1"))
+NODE_TTL = float(os.environ.get("NODE_TTL", "5"))
+SEED_NODES = [u.strip() for u in os.environ.get("FOG_NODES", "").split(",") if u.strip()]
+LOAD_BALANCERS = [u.strip() for u in os.environ.get(
+    "LOAD_BALANCERS", "http://127.0.0.1:5005,http://127.0.0.1:5006,http://127.0.0.1:5007"
+).split(",") if u.strip()]
+
+
+class Membership:
+    """Live fog nodes of one balancer; on_join/on_leave(url) keep its other state in sync."""
+
+    def __init__(self, seeds=SEED_NODES, name="LB", on_join=None, on_leave=None, ttl=NODE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.on_join = on_join
+        self.on_leave = on_leave
+        self.telemetry_port = None   # set by a TelemetryListener (see telemetry.py)
+        self.lock = threading.Lock()
+        now = time.time()
+        # url -> {"joined", "last_seen", "load", "info", "seed", "ready"}; dict order =
+        # registration order. A joining node is "ready" (listed by nodes()) once on_join ran.
+        self.members = {url: {"joined": now, "last_seen": now, "load": None, "info": {},
+                              "seed": True, "ready": True}
+                        for url in seeds}
+        threading.Thread(target=self._evict_loop, name="membership", daemon=True).start()
+
+    def nodes(self):
+        with self.lock:
+            return [url for url, m in self.members.items() if m["ready"]]
+
+    def heartbeat(self, url, load=None, info=None):
+        """Record a heartbeat (registering unknown nodes). Returns True if the node is new."""
+        now = time.time()
+        with self.lock:
+            member = self.members.get(url)
+            joined = member is None
+            if joined:
+                member = self.members[url] = {"joined": now, "load": None, "info": {},
+                                              "ready": False}
+            member.update(last_seen=now, seed=False)
+            if info:
+                member["info"] = info
+        if load is not None:
+            self.update_load(url, load)
+        if joined:
+            print(f"[{self.name}] Node joined: {url}")
+            try:
+                if self.on_join:
+                    self.on_join(url)  # breakers, models... exist before selection can see it
+            finally:
+                with self.lock:
+                    member["ready"] = True
+        return joined
+
+    def update_load(self, url, load):
+        """Store a load report (heartbeat or telemetry datagram) of a registered node.
+
+        Returns False if the node is unknown or a more recent sample is already stored.
+        """
+        # ts = when the node took the sample, not when it reached us
+        load = dict(load, ts=time.time() - load.get("sample_age", 0))
+        with self.lock:
+            member = self.members.get(url)
+            if member is None:
+                return False
+            if member["load"] is not None and member["load"]["ts"] >= load["ts"]:
+                return False
+            member["load"] = load
+        return True
+
+    def deregister(self, url, reason="deregistered"):
+        with self.lock:
+            member = self.members.pop(url, None)
+        if member is not None:
+            print(f"[{self.name}] Node left: {url} ({reason})")
+            if self.on_leave:
+                self.on_leave(url)
+        return member is not None
+
+    def info(self, url):
+        """Static node facts from registration ({} if unknown)."""
+        member = self.members.get(url)
+        return member["info"] if member else {}
+
+    def load(self, url):
+        """Latest load report (heartbeat or telemetry), None if unknown or not reported."""
+        member = self.members.get(url)
+        return member and member["load"]
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(self.ttl / 4)
+            now = time.time()
+            with self.lock:
+                stale = [u for u, m in self.members.items() if now - m["last_seen"] > self.ttl]
+            for url in stale:
+                self.deregister(url, f"no heartbeat for {self.ttl:.0f}s")
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return [{"url": url, "seed": m["seed"], "age": round(now - m["last_seen"], 3),
+                     "info": m["info"], "load": m["load"]}
+                    for url, m in self.members.items() if m["ready"]]
+
+
+def membership_routes(membership):
+    bp = Blueprint("membership", __name__)
+
+    @bp.route("/register", methods=["POST"])
+    @bp.route("/heartbeat", methods=["POST"])
+    def heartbeat():
+        body = request.get_json(silent=True) or {}
+        if not body.get("url"):
+            return jsonify({"error": "url required"}), 400
+        joined = membership.heartbeat(body["url"], body.get("load"), body.get("info"))
+        return jsonify({"registered": joined, "ttl": membership.ttl,
+                        "telemetry_port": membership.telemetry_port}), 201 if joined else 200
+
+    @bp.route("/deregister", methods=["POST"])
+    def deregister():
+        body = request.get_json(silent=True) or {}
+        return jsonify({"removed": membership.deregister(body.get("url"))})
+
+    @bp.route("/nodes")
+    def nodes():
+        return jsonify(membership.snapshot())
+
+    @bp.route("/sd_targets")
+    def sd_targets():
+        # Prometheus http_sd_configs format (see prometheus.yml)
+        targets = [urlparse(url).netloc for url in membership.nodes()]
+        return jsonify([{"targets": targets, "labels": {"balancer": membership.name}}])
+
+    return bp
+
+
+# --- fog node side ---
+
+def advertise_url(port, balancers=LOAD_BALANCERS):
+    """URL the balancers should use for this node: ADVERTISE_URL, or the local address
+    of the interface that routes to the first balancer."""
+    url = os.environ.get("ADVERTISE_URL")
+    if url:
+        return url
+    host = urlparse(balancers[0]).hostname if balancers else "127.0.0.1"
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((host, 9))  # UDP connect sends nothing, it only picks the route
+        ip = s.getsockname()[0]
+    return f"http://{ip}:{port}"
+
+
+def start_heartbeats(url, load_fn, info=None, balancers=LOAD_BALANCERS,
+                     interval=HEARTBEAT_INTERVAL, telemetry=None):
+    """Register `url` with every balancer and keep heartbeating with load_fn() and the
+    static `info` dict as payload.
+
+    Balancers that answer with a telemetry_port are subscribed to `telemetry`
+    (a TelemetrySender) for as long as they keep answering.
+    """
+
+    def beat(lb):
+        path = "register"
+        while True:
+            try:
+                resp = http_pool.post(f"{lb}/{path}", timeout=2,
+                                      json={"url": url, "load": load_fn(), "info": info})
+                resp.raise_for_status()
+                path = "heartbeat"
+                port = resp.json().get("telemetry_port")
+                if telemetry is not None and port:
+                    telemetry.subscribe(lb, urlparse(lb).hostname, port)
+            except Exception:
+                # balancer down: keep trying, the next success registers us again
+                if telemetry is not None:
+                    telemetry.unsubscribe(lb)
+            time.sleep(interval)
+
+    def leave():
+        for lb in balancers:
+            try:
+                http_pool.post(f"{lb}/deregister", json={"url": url}, timeout=1)
+            except Exception:
+                pass
+
+    for lb in balancers:
+        threading.Thread(target=beat, args=(lb,), name=f"heartbeat-{lb}", daemon=True).start()
+    atexit.register(leave)
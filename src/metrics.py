@@ -0,0 +1,23 @@
+# metrics.py → Prometheus exposition shared by fog nodes and load balancers
+#
+# Every process serves its metrics at GET /metrics on its own HTTP port (metrics_routes),
+# the targets Prometheus discovers through /sd_targets (see prometheus.yml). The process
+# is identified by Prometheus' own job/instance labels, so metrics carry no balancer, node
+# or file name of their own. Each side defines its own metrics so a process only exports
+# what it updates: fog_node.py the fog_* ones, lb_metrics.py the lb_* ones.
+from flask import Blueprint, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FILE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = tuple(64 * 1024 * 2 ** k for k in range(11))  # 64 KB .. 64 MB
+
+
+def metrics_routes():
+    bp = Blueprint("metrics", __name__)
+
+    @bp.route("/metrics")
+    def metrics():
+        return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+    return bp
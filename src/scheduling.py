@@ -0,0 +1,292 @@
+# scheduling.py → Node selection strategies shared by the load balancers
+import heapq
+import os
+import threading
+import time
+from collections import deque
+
+MODEL_DECAY = float(os.environ.get("MODEL_DECAY", "0.9"))       # weight kept by older samples
+RTT_PRIOR = float(os.environ.get("RTT_PRIOR", "0.01"))            # s, before anything is learned
+THROUGHPUT_PRIOR = float(os.environ.get("THROUGHPUT_PRIOR", "50")) * 1024 * 1024  # bytes/s
+
+# Chunk sizing (see ChunkSizer): CHUNK_SIZE is used as is when ADAPTIVE_CHUNKS=0
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", str(5 * 1024 * 1024)))
+ADAPTIVE_CHUNKS = os.environ.get("ADAPTIVE_CHUNKS", "1") == "1"
+MIN_CHUNK_SIZE = int(os.environ.get("MIN_CHUNK_SIZE", str(256 * 1024)))
+MAX_CHUNK_SIZE = int(os.environ.get("MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+CHUNKS_PER_LANE = float(os.environ.get("CHUNKS_PER_LANE", "2"))  # of what is left of the file
+CHUNK_SECONDS = float(os.environ.get("CHUNK_SECONDS", "1"))      # target time of one chunk
+MAX_OVERHEAD = float(os.environ.get("MAX_OVERHEAD", "0.1"))      # share of a chunk's time lost to RTT
+CHUNK_ALIGN = 64 * 1024
+
+# Round-robin balancers: "weighted" = smooth weighted round-robin on the capacity each node
+# benchmarked at startup; "plain" = every node gets the same share
+RR_STRATEGY = os.environ.get("RR_STRATEGY", "weighted")
+
+
+def capacity_weights(nodes, info_fn):
+    """{node: weight} from the capacity each node advertised at registration (MB/s).
+
+    Nodes that did not advertise one (yet) get the mean of the others, or 1.0.
+    """
+    known = {n: (info_fn(n) or {}).get("capacity_mbps") for n in nodes}
+    measured = [w for w in known.values() if w]
+    default = sum(measured) / len(measured) if measured else 1.0
+    return {n: w or default for n, w in known.items()}
+
+
+class SmoothWeightedRR:
+    """Smooth weighted round-robin (as in nginx).
+
+    Over any window each node is picked in proportion to its weight, and the picks of a
+    heavy node are interleaved with the others instead of coming in bursts
+    (weights 5:1:1 give a a b a c a a, not a a a a a b c).
+    """
+
+    def __init__(self):
+        self.current = {}
+        self.lock = threading.Lock()
+
+    def pick(self, weights):
+        """Choose among `weights` ({node: weight > 0} of the eligible nodes); None if empty."""
+        if not weights:
+            return None
+        with self.lock:
+            total = 0.0
+            for node, weight in weights.items():
+                self.current[node] = self.current.get(node, 0.0) + weight
+                total += weight
+            best = max(weights, key=lambda n: self.current[n])
+            self.current[best] -= total
+            return best
+
+    def forget(self, node):
+        with self.lock:
+            self.current.pop(node, None)
+
+
+class RoundRobin:
+    """Round-robin node selection of the round-robin balancers, plain or weighted (RR_STRATEGY)."""
+
+    def __init__(self, strategy=RR_STRATEGY):
+        if strategy not in ("weighted", "plain"):
+            raise ValueError(f"RR_STRATEGY must be weighted or plain, not {strategy!r}")
+        self.strategy = strategy
+        self.position = 0
+        self.lock = threading.Lock()
+        self.wrr = SmoothWeightedRR()
+
+    def pick(self, nodes, usable, info_fn, exclude=()):
+        """Next node of `nodes` not in `exclude` that usable(node) accepts (None if none is left).
+
+        info_fn(node) is the node's registration info, where weights come from.
+        """
+        if self.strategy == "weighted":
+            eligible = [n for n in nodes if n not in exclude and usable(n)]
+            return self.wrr.pick(capacity_weights(eligible, info_fn))
+        with self.lock:
+            for _ in range(len(nodes)):
+                node = nodes[self.position % len(nodes)]
+                self.position += 1
+                if node not in exclude and usable(node):
+                    return node
+        return None
+
+    def forget(self, node):
+        self.wrr.forget(node)
+
+
+class NodeModel:
+    """Time of one /task call on a node: rtt + size / throughput, learned online.
+
+    Exponentially weighted least squares over (size, seconds) samples. While all samples
+    have the same size the two terms cannot be told apart, so the RTT stays at its prior
+    and only the throughput is fitted.
+    """
+
+    def __init__(self, rtt=RTT_PRIOR, throughput=THROUGHPUT_PRIOR):
+        self.prior_rtt = rtt
+        self.prior_throughput = throughput
+        self.w = self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.samples = 0
+
+    def observe(self, size, seconds):
+        if size <= 0:
+            return
+        d = MODEL_DECAY
+        self.w = d * self.w + 1
+        self.sx = d * self.sx + size
+        self.sy = d * self.sy + seconds
+        self.sxx = d * self.sxx + size * size
+        self.sxy = d * self.sxy + size * seconds
+        self.samples += 1
+
+    def params(self):
+        """(rtt s, seconds per byte)"""
+        if not self.w:
+            return self.prior_rtt, 1 / self.prior_throughput
+        mx, my = self.sx / self.w, self.sy / self.w
+        var = self.sxx / self.w - mx * mx
+        if var > (0.05 * mx) ** 2:  # sizes spread enough to separate the two terms
+            per_byte = (self.sxy / self.w - mx * my) / var
+            if per_byte > 0:
+                return max(my - per_byte * mx, 0.0), per_byte  # noise can push a tiny RTT below 0
+        rtt = min(self.prior_rtt, my)
+        return rtt, max(my - rtt, 1e-9) / mx
+
+    def predict(self, size):
+        rtt, per_byte = self.params()
+        return rtt + per_byte * size
+
+    def snapshot(self):
+        rtt, per_byte = self.params()
+        return {"rtt": rtt, "throughput_mbps": 1 / per_byte / (1024 * 1024),
+                "samples": self.samples}
+
+
+class ChunkSizer:
+    """NodeModels of a balancer's nodes and the chunk sizes they suggest for a file.
+
+    Guided self-scheduling: each chunk is the rest of the file divided by CHUNKS_PER_LANE
+    times the number of in-flight lanes, so chunks start large and shrink towards the end,
+    where small pieces even out the finishing times. Sizes are kept between
+    - a floor where the per-request RTT stays under MAX_OVERHEAD of the chunk's time, but
+      never above one lane's share of the file, so every node still gets a chunk, and
+    - a cap of CHUNK_SECONDS of transfer at the nodes' mean throughput.
+    """
+
+    def __init__(self, nodes=()):
+        self.models = {node: NodeModel() for node in nodes}
+        self.recent = deque(maxlen=20)
+
+    def add_node(self, node):
+        self.models[node] = NodeModel()  # (re)joining nodes are measured again
+
+    def observe(self, node, size, seconds):
+        model = self.models.get(node)
+        if model is not None:
+            model.observe(size, seconds)
+
+    def sizes(self, total, nodes, lanes):
+        """Chunk sizes for a `total`-byte file (None: unknown) over `nodes`.
+
+        The list covers `total`; the upload repeats the last size if the file is longer.
+        """
+        if not ADAPTIVE_CHUNKS or not nodes:
+            return [CHUNK_SIZE]
+        params = [self.models.get(n, NodeModel()).params() for n in nodes]
+        rtt = sum(p[0] for p in params) / len(params)
+        throughput = sum(1 / p[1] for p in params) / len(params)
+        floor = max(MIN_CHUNK_SIZE, rtt * throughput * (1 - MAX_OVERHEAD) / MAX_OVERHEAD)
+        if total:
+            floor = min(floor, max(MIN_CHUNK_SIZE, total / (len(nodes) * lanes)))
+        cap = max(floor, min(MAX_CHUNK_SIZE, CHUNK_SECONDS * throughput))
+
+        def align(size):
+            return max(CHUNK_ALIGN, int(size) // CHUNK_ALIGN * CHUNK_ALIGN)
+
+        if not total:
+            return [align(cap)]
+        sizes = []
+        remaining = total
+        while remaining > 0:
+            size = min(align(min(max(remaining / (CHUNKS_PER_LANE * len(nodes) * lanes), floor),
+                                 cap)), remaining)
+            sizes.append(size)
+            remaining -= size
+        self.recent.append({"total": total, "chunks": len(sizes), "largest": sizes[0],
+                            "smallest": sizes[-1], "floor": int(floor), "cap": int(cap)})
+        return sizes
+
+    def stats(self):
+        return {
+            "adaptive": ADAPTIVE_CHUNKS,
+            "models": {n: m.snapshot() for n, m in list(self.models.items())},
+            "recent": list(self.recent),
+        }
+
+
+class MakespanPlan:
+    """Assignment of a whole file's chunks to nodes that minimises the predicted makespan.
+
+    Largest chunks first, each to the node lane (a node runs `lanes` chunks at once) that
+    finishes it earliest under the NodeModels. replan() redoes this for the chunks not
+    started yet, from the current state of the running ones, after every completion.
+    """
+
+    def __init__(self, sizes, lanes):
+        self.pending = dict(enumerate(sizes))   # chunk -> expected size, not started
+        self.lanes = lanes
+        self.lock = threading.Lock()
+        self.running = {}                       # chunk -> (node, started, predicted seconds)
+        self.assignment = {}
+        self.chunks = {}                        # node -> chunks it actually ran
+        self.start = time.time()
+        self.predicted = None                   # makespan of the first plan
+        self.replans = 0
+        self.upload_done = False
+        self.finished_at = None
+
+    def replan(self, nodes, models):
+        with self.lock:
+            if not nodes:
+                return
+            now = time.time()
+            free = {n: [now] * self.lanes for n in nodes}
+            for node, started, predicted in self.running.values():
+                if node in free:
+                    heapq.heapreplace(free[node], max(now, started + predicted))
+            assignment = {}
+            for chunk in sorted(self.pending, key=self.pending.get, reverse=True):
+                size = self.pending[chunk]
+                node = min(nodes, key=lambda n: free[n][0] + models[n].predict(size))
+                heapq.heapreplace(free[node], free[node][0] + models[node].predict(size))
+                assignment[chunk] = node
+            self.assignment = assignment
+            if self.predicted is None:
+                self.predicted = max(max(lanes) for lanes in free.values()) - self.start
+            else:
+                self.replans += 1
+
+    def assigned(self, chunk):
+        """Node the current plan gives `chunk` to (None if the chunk was not planned)."""
+        return self.assignment.get(chunk)
+
+    def started(self, chunk, node, predicted):
+        with self.lock:
+            self.pending.pop(chunk, None)
+            self.running[chunk] = (node, time.time(), predicted)
+
+    def finished(self, chunk):
+        """Returns True once the last chunk of the file is done."""
+        with self.lock:
+            entry = self.running.pop(chunk, None)
+            self.pending.pop(chunk, None)
+            if entry is not None:
+                self.chunks[entry[0]] = self.chunks.get(entry[0], 0) + 1
+            return self._check_done()
+
+    def upload_finished(self, chunk_count):
+        """The upload had `chunk_count` chunks: forget planned chunks that never came."""
+        with self.lock:
+            self.upload_done = True
+            for chunk in [c for c in self.pending if c >= chunk_count]:
+                del self.pending[chunk]
+            return self._check_done()
+
+    def _check_done(self):
+        if self.finished_at is None and self.upload_done and not self.pending and not self.running:
+            self.finished_at = time.time()
+            return True
+        return False
+
+    def report(self):
+        actual = (self.finished_at or time.time()) - self.start
+        return {
+            "predicted_makespan": self.predicted,
+            "actual_makespan": actual,
+            "error_pct": 100 * (actual - self.predicted) / self.predicted if self.predicted else None,
+            "replans": self.replans,
+            "chunks_per_node": dict(self.chunks),
+            "done": self.finished_at is not None,
+        }
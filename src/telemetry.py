@@ -0,0 +1,106 @@
+# telemetry.py → Push-based load telemetry (fog node → balancer, UDP)
+#
+# A balancer that wants fresh load data opens a TelemetryListener and returns its UDP port
+# in the /register and /heartbeat answers (see membership.py). The node then sends one
+# datagram per TELEMETRY_INTERVAL to every balancer that asked for it:
+#
+#   "FT" | version | sample_age | cpu % | ram % | tasks_running | queue_depth | encrypt MB/s | url
+#
+# Lost datagrams cost nothing: the next one replaces the snapshot, and heartbeats keep
+# carrying the same load as a slower fallback when UDP is filtered.
+import os
+import socket
+import struct
+import threading
+import time
+
+TELEMETRY_INTERVAL = float(os.environ.get("TELEMETRY_INTERVAL", "0.25"))  # s, node side
+TELEMETRY_PORT = int(os.environ.get("TELEMETRY_PORT", "0"))               # 0 = any free port
+
+MAGIC = b"FT"
+VERSION = 1
+PACKET = struct.Struct("!2sBfffHHf")
+
+
+def encode(url, load):
+    return PACKET.pack(MAGIC, VERSION, load["sample_age"], load["cpu_percent"],
+                       load["ram_percent"], min(load["tasks_running"], 0xFFFF),
+                       min(load.get("queue_depth", 0), 0xFFFF),
+                       load.get("encrypt_mbps", 0.0)) + url.encode()
+
+
+def decode(data):
+    """(url, load dict) from a datagram; raises ValueError if it is not a telemetry packet."""
+    if len(data) <= PACKET.size:
+        raise ValueError("short datagram")
+    magic, version, age, cpu, ram, tasks, queue, mbps = PACKET.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a telemetry datagram")
+    return data[PACKET.size:].decode(), {
+        "sample_age": age,
+        "cpu_percent": cpu,
+        "ram_percent": ram,
+        "tasks_running": tasks,
+        "queue_depth": queue,
+        "encrypt_mbps": mbps,
+    }
+
+
+class TelemetryListener:
+    """Balancer side: feeds datagrams into membership.update_load()."""
+
+    def __init__(self, membership, port=TELEMETRY_PORT):
+        self.membership = membership
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("0.0.0.0", port))
+        self.port = self.sock.getsockname()[1]
+        self.received = 0
+        self.rejected = 0    # malformed, from an unregistered node, or older than what we have
+        membership.telemetry_port = self.port
+        threading.Thread(target=self._loop, name="telemetry", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            data, _ = self.sock.recvfrom(2048)
+            try:
+                url, load = decode(data)
+            except (ValueError, struct.error, UnicodeDecodeError):
+                self.rejected += 1
+                continue
+            if self.membership.update_load(url, load):
+                self.received += 1
+            else:
+                self.rejected += 1
+
+    def stats(self):
+        return {"port": self.port, "received": self.received, "rejected": self.rejected}
+
+
+class TelemetrySender:
+    """Fog node side: pushes load_fn() to every subscribed balancer."""
+
+    def __init__(self, url, load_fn, interval=TELEMETRY_INTERVAL):
+        self.url = url
+        self.load_fn = load_fn
+        self.interval = interval
+        self.targets = {}    # balancer URL -> (host, udp port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        threading.Thread(target=self._loop, name="telemetry", daemon=True).start()
+
+    def subscribe(self, balancer, host, port):
+        self.targets[balancer] = (host, port)
+
+    def unsubscribe(self, balancer):
+        self.targets.pop(balancer, None)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.targets:
+                continue
+            packet = encode(self.url, self.load_fn())
+            for addr in list(self.targets.values()):
+                try:
+                    self.sock.sendto(packet, addr)
+                except OSError:
+                    pass  # unreachable right now; the heartbeat decides when to drop it
@@ -0,0 +1,148 @@
+# tracing.py → Trace IDs and per-chunk timing breakdown (client → balancer → fog node)
+#
+# The client starts a trace per file and sends it to the balancer in a W3C `traceparent`
+# header; the balancer keeps it on the Job and gives every chunk its own span, forwarded
+# to the fog node with the /task call. Stages of a chunk (seconds):
+#   upload      receiving the chunk's bytes from the client
+#   lb_queue    waiting for a dispatcher worker (backpressure included)
+#   dedup       hashing the chunk and looking it up in the dedup cache (see dedup.py)
+#   compress    compressing the chunk before it is sent (see compression.py)
+#   select      choosing a node and waiting for one of its slots
+#   retry       attempts that failed or were shed (503) before the successful one
+#   batch_wait  time in the balancer around the node call: batch window, node slot, hedging
+#   network     node call round trip minus the node's own time
+#   node_queue, receive, aes, serialize   reported by the node (Server-Timing header)
+# Each result entry carries its chunk's breakdown under "trace", and the result body a
+# per-file summary (summarize). The client adds its reassembly time and can export
+# everything as a Chrome trace file (chrome_trace) for chrome://tracing or Perfetto.
+import os
+import time
+import uuid
+
+TRACE_HEADER = "traceparent"
+STAGES = ["upload", "lb_queue", "dedup", "compress", "select", "retry", "batch_wait", "network",
+          "node_queue", "receive", "aes", "serialize"]
+NODE_STAGES = ["node_queue", "receive", "aes", "serialize"]
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+def traceparent(trace_id, span_id=None):
+    return f"00-{trace_id}-{span_id or new_span_id()}-01"
+
+
+def trace_id_from(req):
+    """Trace id of a Flask request's traceparent header (None if absent or malformed)."""
+    parts = req.headers.get(TRACE_HEADER, "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32:
+        return parts[1]
+    return None
+
+
+def server_timing(**stages):
+    """Server-Timing header value from stage durations in seconds."""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items())
+
+
+def parse_server_timing(value):
+    """{name: seconds} from a Server-Timing header value."""
+    stages = {}
+    for metric in (value or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, dur = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(dur) / 1000
+    return stages
+
+
+class ChunkTrace:
+    """Stage breakdown of one chunk on the balancer; each lap charges the time since the
+    previous one (starting when the chunk was received) to a stage."""
+
+    def __init__(self, trace_id, received_at):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.received_at = received_at
+        self.mark = received_at
+        self.stages = {}
+
+    def header(self):
+        return traceparent(self.trace_id, self.span_id)
+
+    def lap(self, stage):
+        now = time.time()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.mark
+        self.mark = now
+
+    def call(self, data):
+        """Split the successful node call (since the last lap) with the node's own report:
+        data["rtt"] is the HTTP exchange, data["node_timing"] the node's Server-Timing."""
+        now = time.time()
+        elapsed = now - self.mark
+        rtt = min(data.get("rtt", elapsed), elapsed)
+        node = data.get("node_timing") or {}
+        node_time = sum(node.get(s, 0.0) for s in NODE_STAGES)
+        self.stages["batch_wait"] = self.stages.get("batch_wait", 0.0) + elapsed - rtt
+        self.stages["network"] = self.stages.get("network", 0.0) + max(rtt - node_time, 0.0)
+        for stage in NODE_STAGES:
+            if stage in node:
+                self.stages[stage] = self.stages.get(stage, 0.0) + node[stage]
+        self.mark = now
+
+    def as_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id,
+                "received_at": self.received_at,
+                "stages": {s: round(v, 6) for s, v in self.stages.items()}}
+
+
+def summarize(results, trace_id, wall=None):
+    """Per-file view of the chunk breakdowns: stage totals over all chunks (they overlap in
+    time, so totals exceed the wall time) and the slowest chunk."""
+    totals = {}
+    slowest = None
+    for r in results:
+        stages = (r.get("trace") or {}).get("stages") or {}
+        for stage, seconds in stages.items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        if stages and (slowest is None or sum(stages.values()) > sum(slowest["stages"].values())):
+            slowest = {"chunk": r["chunk"], "stages": stages}
+    return {
+        "trace_id": trace_id,
+        "wall": wall,
+        "chunks": len(results),
+        "stage_totals": {s: round(totals[s], 6) for s in STAGES if s in totals},
+        "slowest_chunk": slowest,
+    }
+
+
+def chrome_trace(results, summary):
+    """Chrome trace-event JSON: one row per chunk, its stages laid end to end."""
+    traced = [r for r in results if r.get("trace")]
+    if not traced:
+        return {"traceEvents": []}
+    origin = min(r["trace"]["received_at"] - r["trace"]["stages"].get("upload", 0) for r in traced)
+    events = []
+    for r in traced:
+        t = r["trace"]
+        stages = t["stages"]
+        ts = t["received_at"] - stages.get("upload", 0) - origin
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            events.append({"name": stage, "ph": "X", "pid": f"trace {t['trace_id']}",
+                           "tid": f"chunk {r['chunk']}", "ts": ts * 1e6,
+                           "dur": stages[stage] * 1e6,
+                           "args": {"node": r.get("node_used"), "span": t["span_id"]}})
+            ts += stages[stage]
+    if summary.get("reassembly") is not None:
+        end = max(e["ts"] + e["dur"] for e in events) if events else 0
+        events.append({"name": "reassembly", "ph": "X", "pid": f"trace {summary['trace_id']}",
+                       "tid": "client", "ts": end, "dur": summary["reassembly"] * 1e6})
+    return {"traceEvents": events, "otherData": summary}
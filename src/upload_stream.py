@@ -0,0 +1,85 @@
+# upload_stream.py → Incremental multipart upload reader for the load balancers
+#
+# Flask's request.files buffers the whole upload before the view runs. UploadStream
+# instead feeds request.stream through Werkzeug's sans-IO multipart decoder and yields
+# chunks of the "file" part (fixed or per-chunk sizes) as soon as they are complete, so
+# only one chunk (plus whatever the dispatcher queue holds) is in memory at a time.
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, Field, File, NeedData
+
+READ_SIZE = 256 * 1024
+MAX_FIELD_SIZE = 64 * 1024  # non-file form fields are small (e.g. lb_type)
+
+
+class UploadStream:
+    def __init__(self, req, field="file"):
+        self.req = req
+        self.field = field
+        self.filename = None   # set once the file part header has been parsed
+        self.size = 0          # bytes of the file part seen so far
+        self.form = {}         # small non-file fields (only complete after chunks() is exhausted)
+
+    def is_multipart(self):
+        return self.req.mimetype == "multipart/form-data" and "boundary" in self.req.mimetype_params
+
+    def expected_size(self):
+        """Announced body size: Content-Length, or X-Upload-Size when the client relays the
+        upload chunked (None if unknown). Includes the multipart framing."""
+        return self.req.content_length or self.req.headers.get("X-Upload-Size", type=int)
+
+    def chunks(self, chunk_size):
+        """Yield the file part in `chunk_size` pieces (the last one may be shorter).
+
+        `chunk_size` may also be a list with the size of each chunk; its last size is
+        repeated if the file is longer.
+        """
+        sizes = [chunk_size] if isinstance(chunk_size, int) else list(chunk_size)
+        count = 0
+        size = sizes[0]
+        # No max_form_memory_size here: it also caps the decoder's input buffer (> READ_SIZE)
+        decoder = MultipartDecoder(self.req.mimetype_params["boundary"].encode())
+        stream = self.req.stream
+        buf = bytearray()
+        part = None
+        field_value = []
+
+        while True:
+            data = stream.read(READ_SIZE)
+            decoder.receive_data(data or None)  # None tells the decoder the body ended
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, (Field, File)):
+                    part = event
+                    field_value = []
+                    if isinstance(event, File) and event.name == self.field:
+                        self.filename = event.filename
+                elif isinstance(event, Data):
+                    if isinstance(part, File) and part.name == self.field:
+                        self.size += len(event.data)
+                        buf += event.data
+                        while len(buf) >= size:
+                            yield bytes(buf[:size])
+                            del buf[:size]
+                            count += 1
+                            size = sizes[min(count, len(sizes) - 1)]
+                    elif isinstance(part, Field):
+                        field_value.append(event.data)
+                        if sum(map(len, field_value)) > MAX_FIELD_SIZE:
+                            raise RequestEntityTooLarge()
+                        if not event.more_data:
+                            self.form[part.name] = b"".join(field_value).decode("utf-8", "replace")
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not data:
+                break
+
+        if buf:
+            yield bytes(buf)
+
+
+def iter_body(stream, read_size=READ_SIZE):
+    """Re-stream an incoming request body (used by the client to forward uploads unbuffered)."""
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            return
+        yield data
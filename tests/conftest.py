@@ -0,0 +1,5 @@
+# The modules are flat scripts in src/ (run from there), not an installed package
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,29 @@
+import threading
+
+import batching
+from batching import ChunkTask, TaskBatcher
+
+
+def test_batched_tasks_keep_their_plaintext_size(monkeypatch):
+    monkeypatch.setattr(batching, "BATCH_WINDOW", 0.2)
+    seen = []
+
+    def send_request(node, tasks, convergent):
+        seen.append(list(tasks))
+        return [{"result": t.data} for t in tasks]
+
+    batcher = TaskBatcher(send_request)
+    tasks = [ChunkTask(b"z" * 10, None, 1000), ChunkTask(b"y" * 20, None, 2000)]
+    results = [None, None]
+
+    def send(i):
+        results[i] = batcher.send("http://node", tasks[i])
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert [r["result"] for r in results] == [b"z" * 10, b"y" * 20]
+    assert len(seen) == 1  # one request carried both chunks
+    assert sum(t.size for t in seen[0]) == 3000  # what the balancer feeds the sizer
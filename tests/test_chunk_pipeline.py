@@ -0,0 +1,73 @@
+import pytest
+
+import chunk_pipeline
+from chunk_pipeline import ChunkPipeline
+from circuit_breaker import BreakerBoard
+from compression import Compressor
+from dedup import DedupCache
+from hedging import Hedger
+from jobs import Job
+from scheduling import ChunkSizer
+
+NODES = ["http://127.0.0.1:5001", "http://127.0.0.1:5002"]
+
+
+def make_pipeline(nodes, compressor=None, dedup=None):
+    breakers = BreakerBoard(nodes)
+
+    def acquire(job, idx, size, tried):
+        return next((n for n in nodes if n not in tried and breakers.allow(n)), None)
+
+    return ChunkPipeline("test LB", breakers, ChunkSizer(nodes), Hedger(),
+                         compressor or Compressor("off"), dedup or DedupCache(enabled=False), acquire,
+                         alternate=lambda size, exclude: None)
+
+
+def job_with_chunk(chunk):
+    job = Job()
+    job.chunk_received(len(chunk))
+    return job
+
+
+def test_failed_node_is_retried_on_the_next_one(monkeypatch):
+    calls = []
+
+    def post_tasks(node, tasks, convergent=None):
+        calls.append(node)
+        if node == NODES[0]:
+            raise ConnectionError("down")
+        return [{"result": t.data, "key": "k", "nonce": "n", "node_used": 5002} for t in tasks]
+
+    monkeypatch.setattr(chunk_pipeline, "post_tasks", post_tasks)
+    job = job_with_chunk(b"abc")
+    entry = make_pipeline(NODES).process_chunk(job, 0, b"abc")
+    assert calls == NODES
+    assert entry["node_used"] == 5002 and "error" not in entry
+    assert job.spool.read(0) == b"abc"
+
+
+def test_every_node_failing_gives_an_error_entry(monkeypatch):
+    def post_tasks(node, tasks, convergent=None):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(chunk_pipeline, "post_tasks", post_tasks)
+    job = job_with_chunk(b"abc")
+    entry = make_pipeline(NODES).process_chunk(job, 0, b"abc")
+    assert entry["error"] == "all nodes failed"
+    assert entry["processing_time"] == 0  # same keys as a good entry (the client shows them)
+    assert job.progress()["chunks_failed"] == 1
+
+
+def test_exception_after_a_dedup_miss_releases_waiting_duplicates(monkeypatch):
+    class BrokenCompressor:
+        def compress_chunk(self, chunk):
+            raise RuntimeError("boom")
+
+    dedup = DedupCache(enabled=True, secret=b"s")
+    job = job_with_chunk(b"abc")
+    with pytest.raises(RuntimeError):
+        make_pipeline(NODES, BrokenCompressor(), dedup).process_chunk(job, 0, b"abc")
+    assert dedup.pending == {}
+    # the next identical chunk is a plain miss at once instead of waiting DEDUP_WAIT
+    key, cached = dedup.lookup(dedup.salt(job.tenant), b"abc")
+    assert cached is None and key in dedup.pending
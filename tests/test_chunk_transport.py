@@ -0,0 +1,42 @@
+import pytest
+
+from chunk_transport import batch_response_body, decode_batch, decode_batch_response, encode_batch
+
+
+def test_batch_round_trip():
+    chunks = [b"first", b"", b"x" * 70000]
+    assert [bytes(c) for c in decode_batch(encode_batch(chunks))] == chunks
+
+
+@pytest.mark.parametrize("body", [b"\x00\x00", b"\x00\x00\x00\x05abc"])
+def test_truncated_batch_is_a_value_error(body):
+    with pytest.raises(ValueError, match="truncated batch"):
+        decode_batch(body)
+
+
+def test_fog_stub_rejects_bad_batch_and_salt():
+    from fog_stub import app
+
+    client = app.test_client()
+    assert client.post("/task_batch", data=b"\x00\x00").status_code == 400
+    assert client.post("/task", data=b"abc", headers={"X-Convergent-Salt": "zz"}).status_code == 400
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+def test_batch_response_round_trip():
+    results = [(b"ct-one", b"n" * 12, b"k" * 16, 0.5), (b"", b"m" * 12, b"j" * 16, 0.25)]
+    entries = decode_batch_response(FakeResponse(batch_response_body(results, 5002)))
+    assert [e["result"] for e in entries] == [b"ct-one", b""]
+    assert entries[0]["nonce"] == (b"n" * 12).hex() and entries[1]["key"] == (b"j" * 16).hex()
+    assert [e["processing_time"] for e in entries] == [0.5, 0.25]
+    assert {e["node_used"] for e in entries} == {5002}
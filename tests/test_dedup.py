@@ -0,0 +1,29 @@
+import pytest
+
+from dedup import DedupCache
+
+
+def test_dedup_needs_a_secret():
+    with pytest.raises(ValueError):
+        DedupCache(enabled=True, secret=b"")
+    assert DedupCache(enabled=False, secret=b"").salt("t") is None
+
+
+def test_tenants_get_their_own_salts_and_entries():
+    cache = DedupCache(enabled=True, secret=b"s3cret")
+    alice, bob = cache.salt("alice"), cache.salt("bob")
+    assert alice != bob
+    key, cached = cache.lookup(alice, b"chunk")
+    assert cached is None
+    cache.store(key, {"node_used": 5001, "result": b"ct", "key": "k", "nonce": "n",
+                      "codec": "raw", "chunk": 0})
+    assert cache.lookup(alice, b"chunk")[1]["result"] == b"ct"
+    key, cached = cache.lookup(bob, b"chunk")
+    assert cached is None
+    cache.store(key, None)
+    assert cache.stats()["hits"] == 1
+
+
+def test_global_scope_shares_salts():
+    cache = DedupCache(enabled=True, secret=b"s3cret", scope="global")
+    assert cache.salt("alice") == cache.salt("bob")
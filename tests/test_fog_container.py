@@ -0,0 +1,115 @@
+import os
+import zlib
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from decrypt import decrypt_file
+from fog_container import (ENTRY_V1, HEADER, MAGIC, ContainerError, ContainerReader,
+                           ContainerWriter)
+
+CHUNK = 1000
+
+
+def encrypt(plain):
+    key, nonce = AESGCM.generate_key(bit_length=128), os.urandom(12)
+    return key, nonce, AESGCM(key).encrypt(nonce, plain, None)
+
+
+def write_container(path, data, order, kek=None):
+    chunks = [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+    with ContainerWriter(path, chunk_size=CHUNK, kek=kek) as writer:
+        for i in order:
+            key, nonce, ct = encrypt(chunks[i])
+            writer.add_chunk(i, nonce, key, ct)
+    return len(chunks)
+
+
+def test_out_of_order_chunks_round_trip(tmp_path):
+    data = os.urandom(4500)
+    path = str(tmp_path / "f.enc")
+    write_container(path, data, [3, 0, 4, 2, 1])
+    with ContainerReader(path) as reader:
+        assert reader.complete and reader.size == len(data)
+        assert [e["chunk"] for e in reader.entries] == [0, 1, 2, 3, 4]
+        assert reader.read() == data
+
+
+def test_wrapped_keys_and_compressed_chunk(tmp_path):
+    kek = os.urandom(16)
+    text = b"fog " * 500
+    path = str(tmp_path / "f.enc")
+    with ContainerWriter(path, kek=kek) as writer:
+        key, nonce, ct = encrypt(zlib.compress(text))
+        writer.add_chunk(0, nonce, key, ct, plain_length=len(text), codec="zlib")
+    with pytest.raises(ContainerError):
+        ContainerReader(path)
+    with ContainerReader(path, kek=kek) as reader:
+        assert reader.read() == text
+
+
+@pytest.mark.parametrize("offset, length", [(0, 10), (990, 20), (1500, 2500), (4400, 500), (4500, 1)])
+def test_byte_range_read(tmp_path, offset, length):
+    data = os.urandom(4500)
+    path = str(tmp_path / "f.enc")
+    write_container(path, data, range(5))
+    with ContainerReader(path) as reader:
+        assert reader.read(offset, length) == data[offset:offset + length]
+
+
+@pytest.mark.parametrize("offset, length", [(-5, 10), (10, -1), (-1, None)])
+def test_negative_range_is_rejected(tmp_path, offset, length):
+    path = str(tmp_path / "f.enc")
+    write_container(path, os.urandom(2500), range(3))
+    with ContainerReader(path) as reader:
+        with pytest.raises(ValueError):
+            reader.read(offset, length)
+
+
+def test_version_1_file_is_read(tmp_path):
+    data = os.urandom(2500)
+    path = str(tmp_path / "v1.enc")
+    entries, body = [], b""
+    for i, start in enumerate(range(0, len(data), CHUNK)):
+        key, nonce, ct = encrypt(data[start:start + CHUNK])
+        entries.append(ENTRY_V1.pack(i, start, len(ct) - 16, HEADER.size + len(body), len(ct),
+                                     nonce, len(key), key, 16))
+        body += ct
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, 0, CHUNK, len(entries), len(data), HEADER.size + len(body)))
+        f.write(body + b"".join(entries))
+    with ContainerReader(path) as reader:
+        assert reader.entries[0]["codec"] == 0
+        assert reader.read() == data
+        assert reader.read(999, 2) == data[999:1001]
+
+
+def test_tampered_tag_is_rejected(tmp_path):
+    data = os.urandom(2500)
+    path = str(tmp_path / "f.enc")
+    write_container(path, data, range(3))
+    with ContainerReader(path) as reader:
+        entry = reader.entries[1]
+        tag_pos = entry["data_offset"] + entry["data_length"] - 1
+    with open(path, "r+b") as f:
+        f.seek(tag_pos)
+        last = f.read(1)
+        f.seek(tag_pos)
+        f.write(bytes([last[0] ^ 1]))
+    with ContainerReader(path) as reader:
+        assert reader.read(0, 100) == data[:100]  # other chunks still decrypt
+        with pytest.raises(InvalidTag):
+            reader.read(1000, 10)
+    with pytest.raises(ContainerError, match="chunk 1: authentication tag mismatch"):
+        decrypt_file(path, str(tmp_path / "out"), workers=1)
+    assert not os.path.exists(tmp_path / "out")
+
+
+def test_missing_chunk_marks_container_incomplete(tmp_path):
+    path = str(tmp_path / "f.enc")
+    write_container(path, os.urandom(3000), [0, 2])
+    with ContainerReader(path) as reader:
+        assert not reader.complete
+        with pytest.raises(ContainerError):
+            reader.read()
@@ -0,0 +1,38 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_pool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    keep_alive = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        if not self.keep_alive:
+            self.send_header("Connection", "close")  # what Flask's built-in server does
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("keep_alive, misses", [(True, 1), (False, 5)])
+def test_misses_count_tcp_connections(keep_alive, misses):
+    handler = type("H", (Handler,), {"keep_alive": keep_alive})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/health"
+        for _ in range(5):
+            http_pool.get(url, timeout=5).raise_for_status()
+        stats = http_pool.pool_stats()[f"127.0.0.1:{server.server_port}"]
+        assert stats == {"requests": 5, "hits": 5 - misses, "misses": misses}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,41 @@
+from dispatcher import ChunkDispatcher
+from jobs import Job, dispatch_upload
+
+
+class FakeUpload:
+    filename = "f.bin"
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def chunks(self, chunk_size):
+        return iter(self._chunks)
+
+
+def test_exception_in_process_chunk_becomes_an_error_entry():
+    def process_chunk(job, idx, chunk):
+        if idx == 1:
+            raise RuntimeError("boom")
+        return job.add_result({"chunk": idx, "result": bytes(chunk), "key": "", "nonce": ""})
+
+    job = Job()
+    futures = dispatch_upload(job, FakeUpload([b"a", b"b", b"c"]), 1,
+                              ChunkDispatcher([], workers=2), process_chunk)
+    for f in futures:
+        f.result(timeout=5)
+    assert job.wait_done(5)
+    results = job.sorted_results()
+    assert [r["chunk"] for r in results] == [0, 1, 2]
+    assert "boom" in results[1]["error"]
+    assert job.progress()["chunks_failed"] == 1
+
+
+def test_exception_after_add_result_is_not_counted_twice():
+    def process_chunk(job, idx, chunk):
+        job.add_result({"chunk": idx, "result": bytes(chunk), "key": "", "nonce": ""})
+        raise RuntimeError("late")
+
+    job = Job()
+    dispatch_upload(job, FakeUpload([b"a"]), 1, ChunkDispatcher([], workers=1), process_chunk)
+    assert job.wait_done(5)
+    assert job.progress()["chunks_done"] == 1
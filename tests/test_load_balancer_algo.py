@@ -0,0 +1,13 @@
+import load_balancer_algo as lb
+
+BODY = (b"--xx\r\nContent-Disposition: form-data; name=\"file\"; filename=\"f.bin\"\r\n"
+        b"Content-Type: application/octet-stream\r\n\r\n" + b"a" * 5000)  # no closing boundary
+
+
+def test_broken_upload_drops_its_makespan_plan(monkeypatch):
+    monkeypatch.setattr(lb, "SCHEDULER", "makespan")
+    client = lb.app.test_client()
+    resp = client.post("/process_file", data=BODY, content_type="multipart/form-data; boundary=xx")
+    assert resp.status_code == 500
+    assert lb.plans == {}
+    assert client.get("/schedule_stats").get_json()["planning"] == 0
@@ -0,0 +1,22 @@
+from circuit_breaker import BreakerBoard
+from membership import Membership
+
+
+def test_joining_node_is_hidden_until_on_join_ran():
+    board = BreakerBoard([])
+    seen = []
+
+    def on_join(url):
+        seen.append(list(membership.nodes()))
+        board.add_node(url)
+
+    membership = Membership([], on_join=on_join)
+    assert membership.heartbeat("http://n1")
+    assert seen == [[]]
+    assert membership.nodes() == ["http://n1"]
+    assert board.allow("http://n1")
+    assert not membership.heartbeat("http://n1")
+
+
+def test_unknown_node_is_not_allowed():
+    assert not BreakerBoard([]).allow("http://nowhere")
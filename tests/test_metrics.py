@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), os.pardir, "src")
+
+SCRAPE = """
+import fog_stub
+body = fog_stub.app.test_client().get("/metrics").get_data(as_text=True)
+print(sum(line.startswith("lb_") for line in body.splitlines()))
+"""
+
+
+def test_fog_node_exports_no_balancer_metrics():
+    # In a fresh interpreter: the default registry is process-wide
+    out = subprocess.run([sys.executable, "-c", SCRAPE], cwd=SRC, capture_output=True,
+                         text=True, check=True).stdout
+    assert out.strip() == "0"
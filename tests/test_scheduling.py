@@ -0,0 +1,63 @@
+from scheduling import CHUNK_ALIGN, MIN_CHUNK_SIZE, ChunkSizer, RoundRobin
+
+MB = 1024 * 1024
+NODES = ["http://n1", "http://n2", "http://n3"]
+LANES = 2
+
+
+def slow_rtt_sizer():
+    """Models that learned a 40 ms RTT at ~300 MB/s: an RTT floor of ~100 MB."""
+    sizer = ChunkSizer(NODES)
+    for node in NODES:
+        for size in (1 * MB, 4 * MB, 8 * MB, 16 * MB) * 5:
+            sizer.observe(node, size, 0.04 + size / (300 * MB))
+    return sizer
+
+
+def check_cover(sizes, total):
+    assert sum(sizes) == total
+    assert all(s > 0 for s in sizes)
+    assert all(s % CHUNK_ALIGN == 0 for s in sizes[:-1])
+
+
+def test_small_file_spreads_over_all_nodes():
+    for sizer in (ChunkSizer(NODES), slow_rtt_sizer()):
+        total = 13 * MB
+        sizes = sizer.sizes(total, NODES, LANES)
+        check_cover(sizes, total)
+        assert len(sizes) >= len(NODES)
+
+
+def test_medium_file_spreads_over_all_lanes():
+    for sizer in (ChunkSizer(NODES), slow_rtt_sizer()):
+        total = 30 * MB
+        sizes = sizer.sizes(total, NODES, LANES)
+        check_cover(sizes, total)
+        assert len(sizes) >= len(NODES) * LANES
+
+
+def test_tiny_file_is_one_chunk():
+    sizes = ChunkSizer(NODES).sizes(MIN_CHUNK_SIZE // 2, NODES, LANES)
+    assert sizes == [MIN_CHUNK_SIZE // 2]
+
+
+def test_unknown_size_gives_one_repeated_size():
+    sizes = ChunkSizer(NODES).sizes(None, NODES, LANES)
+    assert len(sizes) == 1 and sizes[0] >= MIN_CHUNK_SIZE
+
+
+def test_weighted_round_robin_follows_capacity():
+    capacity = {"http://n1": 300, "http://n2": 100, "http://n3": 100}
+    rotation = RoundRobin("weighted")
+    picks = [rotation.pick(NODES, lambda n: True, lambda n: {"capacity_mbps": capacity[n]})
+             for _ in range(50)]
+    assert [picks.count(n) for n in NODES] == [30, 10, 10]
+
+
+def test_plain_round_robin_skips_excluded_and_unusable_nodes():
+    rotation = RoundRobin("plain")
+    usable = lambda n: n != "http://n3"
+    picks = [rotation.pick(NODES, usable, lambda n: {}, exclude={"http://n1"}) for _ in range(3)]
+    assert picks == ["http://n2"] * 3
+    assert rotation.pick(NODES, usable, lambda n: {}, exclude={"http://n2"}) == "http://n1"
+    assert rotation.pick(NODES, usable, lambda n: {}, exclude=set(NODES)) is None
@@ -0,0 +1,25 @@
+import pytest
+
+from telemetry import PACKET, decode, encode
+
+LOAD = {"sample_age": 0.25, "cpu_percent": 42.5, "ram_percent": 61.0, "tasks_running": 3,
+        "queue_depth": 7, "encrypt_mbps": 812.0}
+
+
+def test_round_trip():
+    url, load = decode(encode("http://10.0.0.7:5002", LOAD))
+    assert url == "http://10.0.0.7:5002"
+    assert load == LOAD
+
+
+def test_counters_saturate_instead_of_overflowing():
+    _, load = decode(encode("http://n", dict(LOAD, tasks_running=70000, queue_depth=10 ** 6)))
+    assert load["tasks_running"] == load["queue_depth"] == 0xFFFF
+
+
+@pytest.mark.parametrize("data", [b"", b"FT\x01", encode("http://n", LOAD)[:PACKET.size],
+                                  b"XX" + encode("http://n", LOAD)[2:],
+                                  b"FT\x02" + encode("http://n", LOAD)[3:]])
+def test_foreign_or_short_datagrams_are_rejected(data):
+    with pytest.raises(ValueError):
+        decode(data)